@@ -0,0 +1,125 @@
+import os
+import sqlite3
+from collections import OrderedDict
+
+import chess
+import chess.engine
+import chess.polyglot
+
+
+def position_key(board):
+    return chess.polyglot.zobrist_hash(board)
+
+
+def _signed(key):
+    # SQLite integers are signed 64 bit, Zobrist hashes are unsigned
+    return key - (1 << 64) if key >= (1 << 63) else key
+
+
+class AnalysisCache:
+    # Best engine result per multipv slot for every analysed position, keyed by Zobrist hash.
+    # Positions are kept in memory with LRU eviction; with a path the cache is also
+    # persisted to SQLite so results survive restarts. A slot is only replaced by a result
+    # of the same or greater depth.
+    def __init__(self, path=None, max_positions=50000):
+        self.path = path
+        self.max_positions = max_positions
+        self.positions = OrderedDict()
+        self.dirty = {}
+        self.connection = None
+        if path:
+            self.connection = sqlite3.connect(path)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS analysis ("
+                "key INTEGER, multipv INTEGER, depth INTEGER, seldepth INTEGER, "
+                "turn INTEGER, cp INTEGER, mate INTEGER, pv TEXT, "
+                "PRIMARY KEY (key, multipv))")
+            self.connection.commit()
+
+    def get(self, key):
+        # Returns {multipv: info} with depth, seldepth, score, pv and multipv, or None
+        slots = self.positions.get(key)
+        if slots is not None:
+            self.positions.move_to_end(key)
+            return slots
+        if self.connection is None:
+            return None
+        rows = self.connection.execute(
+            "SELECT multipv, depth, seldepth, turn, cp, mate, pv FROM analysis WHERE key = ?",
+            (_signed(key),)).fetchall()
+        if not rows:
+            return None
+        slots = {}
+        for multipv, depth, seldepth, turn, cp, mate, pv in rows:
+            score = chess.engine.Cp(cp) if mate is None else chess.engine.Mate(mate)
+            slots[multipv] = {
+                "depth": depth,
+                "seldepth": seldepth,
+                "score": chess.engine.PovScore(score, bool(turn)),
+                "pv": [chess.Move.from_uci(move) for move in pv.split()],
+                "multipv": multipv,
+            }
+        self._remember(key, slots)
+        return slots
+
+    def put(self, key, info):
+        # Stores an engine info if it is at least as deep as the cached one, returns whether it was stored
+        depth, score, pv = info.get("depth"), info.get("score"), info.get("pv")
+        if depth is None or score is None or not pv:
+            return False
+        multipv = info.get("multipv", 1)
+        slots = self.get(key)
+        if slots is None:
+            slots = {}
+            self._remember(key, slots)
+        cached = slots.get(multipv)
+        if cached is not None and cached["depth"] > depth:
+            return False
+        slots[multipv] = {
+            "depth": depth,
+            "seldepth": info.get("seldepth"),
+            "score": score,
+            "pv": list(pv),
+            "multipv": multipv,
+        }
+        if self.connection is not None:
+            self.dirty[(key, multipv)] = slots[multipv]
+        return True
+
+    def flush(self):
+        # Writes results stored since the last flush in one transaction
+        if self.connection is None or not self.dirty:
+            return
+        rows = []
+        for (key, multipv), info in self.dirty.items():
+            score = info["score"]
+            relative = score.relative
+            rows.append((
+                _signed(key), multipv, info["depth"], info["seldepth"], int(score.turn),
+                relative.score(), relative.mate(), " ".join(move.uci() for move in info["pv"])))
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO analysis VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.dirty = {}
+
+    def close(self):
+        self.flush()
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def _remember(self, key, slots):
+        self.positions[key] = slots
+        self.positions.move_to_end(key)
+        while len(self.positions) > self.max_positions:
+            self.positions.popitem(last=False)
+
+
+_analysis_cache = None
+
+
+def get_analysis_cache():
+    # Shared cache; set ILMARINEN_ANALYSIS_CACHE to a file path to persist it across runs
+    global _analysis_cache
+    if _analysis_cache is None:
+        _analysis_cache = AnalysisCache(os.environ.get('ILMARINEN_ANALYSIS_CACHE'))
+    return _analysis_cache
@@ -0,0 +1,18 @@
+# Engine output handling shared by the GUI and headless code, kept free of Qt.
+
+
+def parse_info(info):
+    try:
+        pv = [str(move) for move in info["pv"]]
+        lines = " ".join(map(str, pv))
+        # get values from info or default to None if they are not existent
+        depth, seldepth = info.get("depth", None), info.get("seldepth", None)
+        score = info.get("score", None)
+        multipv = info.get("multipv", None)
+        if "source" in info:
+            # book and tablebase lines have no search depth
+            return {"depth": info["source"], "score": score, "lines": f"{lines}  ({info.get('comment', '')})",
+                    "multipv": multipv}
+        return {"depth": f"{depth}/{seldepth}", "score": score, "lines": lines, "multipv": multipv}
+    except Exception as e:
+        print(str(e))
@@ -0,0 +1,79 @@
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+
+class AnalysisLinesModel(QAbstractTableModel):
+    # Latest parsed engine info per multipv slot. Engine output only lands in `pending`,
+    # the view is touched in flush(), which the engine widget calls at a capped rate.
+    headers = ['#', 'Score', 'Depth', 'Line']
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.lines = []
+        self.pending = {}
+
+    def post(self, parsed_result):
+        multipv = parsed_result.get('multipv') or 1
+        self.pending[multipv] = parsed_result
+
+    def flush(self):
+        # Returns the multipv slots that were repainted
+        if not self.pending:
+            return []
+        changed = sorted(self.pending)
+        for multipv in changed:
+            row = multipv - 1
+            if row < len(self.lines):
+                self.lines[row] = self.pending[multipv]
+                self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.headers) - 1))
+            else:
+                # slots arrive in order, but fill gaps in case the engine skipped one
+                first = len(self.lines)
+                self.beginInsertRows(QModelIndex(), first, row)
+                self.lines.extend([None] * (row - first))
+                self.lines.append(self.pending[multipv])
+                self.endInsertRows()
+        self.pending = {}
+        return changed
+
+    def truncate(self, number_of_lines):
+        self.pending = {multipv: parsed for multipv, parsed in self.pending.items() if multipv <= number_of_lines}
+        if len(self.lines) > number_of_lines:
+            self.beginRemoveRows(QModelIndex(), number_of_lines, len(self.lines) - 1)
+            del self.lines[number_of_lines:]
+            self.endRemoveRows()
+
+    def clear(self):
+        self.pending = {}
+        self.beginResetModel()
+        self.lines = []
+        self.endResetModel()
+
+    def best_line(self):
+        return self.lines[0] if self.lines else None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.lines)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.headers[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+        parsed_result = self.lines[index.row()]
+        if parsed_result is None:
+            return None
+        column = index.column()
+        if column == 0:
+            return str(index.row() + 1)
+        if column == 1:
+            score = parsed_result.get('score')
+            return str(score.white()) if score is not None else ''
+        if column == 2:
+            return parsed_result.get('depth')
+        return parsed_result.get('lines')
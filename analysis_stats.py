@@ -0,0 +1,134 @@
+import csv
+import json
+import statistics
+import time
+from collections import deque
+
+
+class AnalysisStats:
+    # Timing and throughput of one engine widget: engine info arrival, the capped-rate flush
+    # into the lines model, the repaint of the analysis panes and of the linked board, and
+    # the lag of the asyncio loop in between. Every hook is guarded by `enabled` at the call
+    # site, so a disabled collector costs one attribute check per engine message.
+    latency_names = ('info_to_flush', 'flush_to_paint', 'info_to_paint', 'move_to_board_paint', 'event_loop_lag')
+
+    def __init__(self, max_records=100000, rate_window=2.0):
+        self.enabled = False
+        self.records = deque(maxlen=max_records)
+        self.rate_window = rate_window
+        self.info_times = deque()
+        self.latencies = {name: deque(maxlen=500) for name in self.latency_names}
+        self.search_started_at = None
+        self.depth_progression = []
+        self.depth = self.seldepth = self.nodes = self.nps = None
+        # perf_counter of the oldest info not yet flushed / flushed but not yet painted
+        self.pending_since = None
+        self.flushed_at = None
+        self.painting_since = None
+        self.moved_at = None
+
+    def record(self, event, **fields):
+        fields['event'] = event
+        fields['time'] = time.time()
+        self.records.append(fields)
+
+    def search_started(self):
+        self.search_started_at = time.perf_counter()
+        self.depth_progression = []
+        self.record('search_started')
+
+    def info_received(self, info):
+        now = time.perf_counter()
+        self.info_times.append(now)
+        if self.pending_since is None:
+            self.pending_since = now
+        depth = info.get('depth')
+        self.seldepth = info.get('seldepth', self.seldepth)
+        self.nodes = info.get('nodes', self.nodes)
+        self.nps = info.get('nps', self.nps)
+        if depth is not None:
+            if self.search_started_at is not None and (not self.depth_progression or depth > self.depth_progression[-1][1]):
+                self.depth_progression.append((now - self.search_started_at, depth))
+            self.depth = depth
+        self.record('info', multipv=info.get('multipv', 1), depth=depth, seldepth=info.get('seldepth'),
+                    nodes=info.get('nodes'), nps=info.get('nps'))
+
+    def results_flushed(self):
+        if self.pending_since is None:
+            return
+        now = time.perf_counter()
+        latency = (now - self.pending_since) * 1000
+        self.latencies['info_to_flush'].append(latency)
+        self.painting_since, self.flushed_at, self.pending_since = self.pending_since, now, None
+        self.record('flush', info_to_flush_ms=latency)
+
+    def results_painted(self):
+        if self.painting_since is None:
+            return
+        now = time.perf_counter()
+        flush_to_paint = (now - self.flushed_at) * 1000
+        info_to_paint = (now - self.painting_since) * 1000
+        self.latencies['flush_to_paint'].append(flush_to_paint)
+        self.latencies['info_to_paint'].append(info_to_paint)
+        self.painting_since = self.flushed_at = None
+        self.record('paint', flush_to_paint_ms=flush_to_paint, info_to_paint_ms=info_to_paint)
+
+    def position_changed(self):
+        self.moved_at = time.perf_counter()
+
+    def board_painted(self):
+        if self.moved_at is None:
+            return
+        latency = (time.perf_counter() - self.moved_at) * 1000
+        self.latencies['move_to_board_paint'].append(latency)
+        self.moved_at = None
+        self.record('board_paint', move_to_board_paint_ms=latency)
+
+    def event_loop_lag(self, lag_ms):
+        self.latencies['event_loop_lag'].append(lag_ms)
+        self.record('event_loop_lag', event_loop_lag_ms=lag_ms)
+
+    def info_rate(self):
+        now = time.perf_counter()
+        while self.info_times and now - self.info_times[0] > self.rate_window:
+            self.info_times.popleft()
+        return len(self.info_times) / self.rate_window
+
+    def summary(self):
+        summary = {
+            'info_rate': self.info_rate(),
+            'nps': self.nps,
+            'nodes': self.nodes,
+            'depth': self.depth,
+            'seldepth': self.seldepth,
+            'depth_progression': list(self.depth_progression),
+        }
+        for name, samples in self.latencies.items():
+            if samples:
+                ordered = sorted(samples)
+                summary[name] = (statistics.median(ordered), ordered[int(len(ordered) * 0.95)])
+            else:
+                summary[name] = None
+        return summary
+
+    def export(self, path):
+        # CSV for a .csv path, JSON lines otherwise
+        records = list(self.records)
+        with open(path, 'w', newline='') as output:
+            if path.lower().endswith('.csv'):
+                fields = ['time', 'event']
+                for record in records:
+                    fields.extend(name for name in record if name not in fields)
+                writer = csv.DictWriter(output, fieldnames=fields)
+                writer.writeheader()
+                writer.writerows(records)
+            else:
+                for record in records:
+                    output.write(json.dumps(record) + '\n')
+        return len(records)
+
+    def clear(self):
+        self.records.clear()
+        self.info_times.clear()
+        for samples in self.latencies.values():
+            samples.clear()
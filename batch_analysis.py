@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+import chess
+import chess.engine
+import chess.pgn
+
+from Ilmarinen.engine_session import create_session
+
+# Headless annotation of PGN files: games are streamed from disk, their positions are
+# spread over a pool of engine processes and every game is written out as soon as all
+# of its positions are done. Completed games are recorded in a checkpoint file so an
+# interrupted run picks up where it stopped. Nothing here imports Qt.
+
+
+def score_to_json(score):
+    # white point of view, like the engine widget shows it
+    white = score.white()
+    return {"mate": white.mate()} if white.is_mate() else {"cp": white.score()}
+
+
+def info_to_json(info):
+    return {
+        "multipv": info.get("multipv", 1),
+        "depth": info.get("depth"),
+        "seldepth": info.get("seldepth"),
+        "score": score_to_json(info["score"]),
+        "pv": [move.uci() for move in info.get("pv", [])],
+    }
+
+
+class GameJob:
+    def __init__(self, game_id, game):
+        self.game_id = game_id
+        self.game = game
+        self.nodes = [game] + list(game.mainline())
+        self.boards = []
+        board = game.board()
+        for node in self.nodes:
+            if node.move is not None:
+                board.push(node.move)
+            self.boards.append(board.copy())
+        # analysis per node index, None for positions that were not searched (game over)
+        self.results = [None] * len(self.nodes)
+        self.remaining = len(self.nodes)
+        self.done = asyncio.Event()
+
+    def position_done(self, index, infos):
+        self.results[index] = infos
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.done.set()
+
+
+class BatchAnalysis:
+    def __init__(self, engine_command, output_path, limit, workers=None, threads=1, hash_mb=64, multipv=1,
+                 output_format=None):
+        self.engine_command = engine_command
+        self.output_path = output_path
+        self.checkpoint_path = output_path + '.checkpoint'
+        self.limit = limit
+        self.workers = workers or os.cpu_count() or 1
+        self.threads = threads
+        self.hash_mb = hash_mb
+        self.multipv = multipv
+        if output_format is None:
+            output_format = 'pgn' if output_path.lower().endswith('.pgn') else 'jsonl'
+        self.output_format = output_format
+        self.completed = self.load_checkpoint()
+        self.queue = asyncio.Queue()
+        # bounds the number of games held in memory while positions are in flight
+        self.pending_games = asyncio.Semaphore(self.workers * 4)
+        self.finished_games = 0
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return set()
+        with open(self.checkpoint_path) as checkpoint:
+            return {line.strip() for line in checkpoint if line.strip()}
+
+    async def run(self, pgn_paths):
+        sessions = [create_session(self.engine_command) for _ in range(self.workers)]
+        for session in sessions:
+            session.options = {"Threads": self.threads, "Hash": self.hash_mb}
+        workers = [asyncio.create_task(self.worker(session)) for session in sessions]
+        feeding = asyncio.create_task(self.feed(pgn_paths))
+        try:
+            # workers only end by failing, e.g. when the engine cannot be started; the run stops with that error
+            await asyncio.wait([feeding, *workers], return_when=asyncio.FIRST_COMPLETED)
+            for worker in workers:
+                if worker.done():
+                    raise worker.exception()
+            await feeding
+        finally:
+            for task in [feeding, *workers]:
+                task.cancel()
+            await asyncio.gather(feeding, *workers, return_exceptions=True)
+            await asyncio.gather(*(session.quit() for session in sessions), return_exceptions=True)
+        print(f"Analysed {self.finished_games} games")
+
+    async def feed(self, pgn_paths):
+        with open(self.output_path, 'a') as output, open(self.checkpoint_path, 'a') as checkpoint:
+            writers = []
+            try:
+                for game_job in self.read_games(pgn_paths):
+                    await self.pending_games.acquire()
+                    for index, board in enumerate(game_job.boards):
+                        if board.is_game_over():
+                            game_job.position_done(index, None)
+                        else:
+                            self.queue.put_nowait((game_job, index, board, 0))
+                    writers.append(asyncio.create_task(self.write_game(game_job, output, checkpoint)))
+                    writers = [writer for writer in writers if not writer.done()]
+                    # let the workers and writers run between games
+                    await asyncio.sleep(0)
+                await asyncio.gather(*writers)
+            finally:
+                for writer in writers:
+                    writer.cancel()
+
+    def read_games(self, pgn_paths):
+        for path in pgn_paths:
+            with open(path, encoding='utf-8', errors='replace') as pgn:
+                index = 0
+                while True:
+                    game_id = f"{os.path.abspath(path)}:{index}"
+                    if game_id in self.completed:
+                        if not chess.pgn.skip_game(pgn):
+                            break
+                    else:
+                        game = chess.pgn.read_game(pgn)
+                        if game is None:
+                            break
+                        yield GameJob(game_id, game)
+                    index += 1
+
+    async def worker(self, session):
+        current_game = None
+        while True:
+            game_job, index, board, attempts = await self.queue.get()
+            if game_job is not current_game:
+                # hash entries of another game are no help, the engine gets ucinewgame
+                session.new_game()
+                current_game = game_job
+            try:
+                infos = await session.analyse(board, self.limit, multipv=self.multipv)
+            except OSError as e:
+                # the engine cannot be started at all, no point in trying the other positions
+                raise RuntimeError(f"Cannot start engine {self.engine_command}: {str(e)}") from e
+            except chess.engine.EngineError as e:
+                # the session restarts a dead engine, give the position one more try
+                print(f"Engine failed on game {game_job.game_id} ply {index}: {str(e)}")
+                if attempts < 1:
+                    self.queue.put_nowait((game_job, index, board, attempts + 1))
+                else:
+                    game_job.position_done(index, None)
+                continue
+            finally:
+                self.queue.task_done()
+            game_job.position_done(index, infos)
+
+    async def write_game(self, game_job, output, checkpoint):
+        await game_job.done.wait()
+        try:
+            if self.output_format == 'pgn':
+                output.write(self.annotated_pgn(game_job) + "\n\n")
+            else:
+                output.write(json.dumps(self.game_json(game_job)) + "\n")
+            output.flush()
+            # the checkpoint is written after the output, an interruption in between repeats the game
+            checkpoint.write(game_job.game_id + "\n")
+            checkpoint.flush()
+            self.finished_games += 1
+        finally:
+            self.pending_games.release()
+
+    def game_json(self, game_job):
+        positions = []
+        for index, node in enumerate(game_job.nodes):
+            infos = game_job.results[index]
+            positions.append({
+                "ply": index,
+                "move": node.move.uci() if node.move else None,
+                "fen": game_job.boards[index].fen(),
+                "lines": [info_to_json(info) for info in infos if "score" in info] if infos else [],
+            })
+        return {"game": game_job.game_id, "headers": dict(game_job.game.headers), "positions": positions}
+
+    def annotated_pgn(self, game_job):
+        for index, node in enumerate(game_job.nodes):
+            infos = game_job.results[index]
+            if infos and "score" in infos[0]:
+                node.set_eval(infos[0]["score"], infos[0].get("depth"))
+        return str(game_job.game)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Annotate PGN files with a UCI engine, without the GUI.')
+    parser.add_argument('engine', help='path to the UCI engine executable, or tcp://host:port/name of an engine server')
+    parser.add_argument('pgn', nargs='+', help='PGN files to analyse')
+    parser.add_argument('-o', '--output', required=True, help='output file, .pgn for annotated PGN, JSON lines otherwise')
+    parser.add_argument('--format', choices=['pgn', 'jsonl'], help='output format, guessed from the output name by default')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='number of engine processes')
+    parser.add_argument('--threads', type=int, default=1, help='Threads per engine process')
+    parser.add_argument('--hash', type=int, default=64, help='Hash per engine process in MB')
+    parser.add_argument('--multipv', type=int, default=1)
+    parser.add_argument('--depth', type=int, help='depth limit per position')
+    parser.add_argument('--nodes', type=int, help='node limit per position')
+    parser.add_argument('--time', type=float, help='time limit per position in seconds')
+    args = parser.parse_args()
+
+    if args.depth is None and args.nodes is None and args.time is None:
+        args.depth = 18
+    limit = chess.engine.Limit(depth=args.depth, nodes=args.nodes, time=args.time)
+    batch = BatchAnalysis(args.engine, args.output, limit, workers=args.workers, threads=args.threads,
+                          hash_mb=args.hash, multipv=args.multipv, output_format=args.format)
+    try:
+        asyncio.run(batch.run(args.pgn))
+    except RuntimeError as e:
+        sys.exit(str(e))
+
+
+if __name__ == '__main__':
+    main()
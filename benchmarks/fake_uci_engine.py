@@ -0,0 +1,149 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+import chess
+
+# A scriptable stand-in for a UCI engine. It plays no chess: it emits info lines with
+# legal moves at a fixed rate, one per multipv slot per depth, so engine throughput and
+# UI latency can be measured without a real engine binary.
+#
+#   python fake_uci_engine.py --info-rate 2000 --max-depth 60
+
+
+def fake_engine_command(info_rate, max_depth=10 ** 6):
+    # the command line that runs this engine, for EngineSession and the engine server
+    return [sys.executable, os.path.abspath(__file__), '--info-rate', str(info_rate), '--max-depth', str(max_depth)]
+
+
+class FakeEngine:
+    def __init__(self, info_rate, max_depth, pv_length):
+        self.info_rate = info_rate
+        self.max_depth = max_depth
+        self.pv_length = pv_length
+        self.multipv = 1
+        self.board = chess.Board()
+        self.output_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.search_thread = None
+
+    def send(self, line):
+        with self.output_lock:
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+    def pv(self, first_move):
+        board = self.board.copy(stack=False)
+        moves = []
+        move = first_move
+        while move is not None and len(moves) < self.pv_length:
+            moves.append(move.uci())
+            board.push(move)
+            move = next(iter(board.legal_moves), None)
+        return " ".join(moves)
+
+    def search(self, depth_limit, node_limit, time_limit):
+        started = time.perf_counter()
+        root_moves = list(self.board.legal_moves)
+        if not root_moves:
+            self.send("info depth 0 score mate 0" if self.board.is_check() else "info depth 0 score cp 0")
+            self.send("bestmove (none)")
+            return
+        lines = [self.pv(move) for move in root_moves[:self.multipv]]
+        interval = 1.0 / self.info_rate if self.info_rate else 0
+        next_info = started
+        nodes = 0
+        depth = 1
+        while not self.stop_event.is_set():
+            for multipv, line in enumerate(lines, start=1):
+                nodes += 1000
+                elapsed = time.perf_counter() - started
+                nps = int(nodes / elapsed) if elapsed > 0 else 0
+                self.send(f"info depth {depth} seldepth {depth + 4} multipv {multipv} score cp {25 - 10 * multipv + depth % 7} "
+                          f"nodes {nodes} nps {nps} time {int(elapsed * 1000)} pv {line}")
+                next_info += interval
+                delay = next_info - time.perf_counter()
+                if delay > 0:
+                    self.stop_event.wait(delay)
+            if depth_limit is not None and depth >= depth_limit or depth >= self.max_depth:
+                break
+            if node_limit is not None and nodes >= node_limit:
+                break
+            if time_limit is not None and time.perf_counter() - started >= time_limit:
+                break
+            depth += 1
+        if depth >= self.max_depth and depth_limit is None and node_limit is None and time_limit is None:
+            # an infinite search only ends on stop
+            self.stop_event.wait()
+        self.send(f"bestmove {root_moves[0].uci()}")
+
+    def go(self, tokens):
+        def value(name, convert):
+            return convert(tokens[tokens.index(name) + 1]) if name in tokens else None
+
+        depth_limit = value("depth", int)
+        node_limit = value("nodes", int)
+        movetime = value("movetime", int)
+        time_limit = movetime / 1000 if movetime is not None else None
+        self.stop_event.clear()
+        self.search_thread = threading.Thread(target=self.search, args=(depth_limit, node_limit, time_limit))
+        self.search_thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.search_thread is not None:
+            self.search_thread.join()
+            self.search_thread = None
+
+    def position(self, tokens):
+        if tokens[1] == "startpos":
+            board = chess.Board()
+            rest = tokens[2:]
+        else:
+            board = chess.Board(" ".join(tokens[2:8]))
+            rest = tokens[8:]
+        if rest and rest[0] == "moves":
+            for move in rest[1:]:
+                board.push_uci(move)
+        self.board = board
+
+    def run(self):
+        for line in sys.stdin:
+            tokens = line.split()
+            if not tokens:
+                continue
+            command = tokens[0]
+            if command == "uci":
+                self.send("id name Ilmarinen fake engine")
+                self.send("option name MultiPV type spin default 1 min 1 max 500")
+                self.send("option name Threads type spin default 1 min 1 max 1024")
+                self.send("option name Hash type spin default 16 min 1 max 33554432")
+                self.send("uciok")
+            elif command == "isready":
+                self.send("readyok")
+            elif command == "setoption" and len(tokens) >= 5 and tokens[2] == "MultiPV":
+                self.multipv = int(tokens[4])
+            elif command == "position":
+                self.position(tokens)
+            elif command == "go":
+                self.go(tokens)
+            elif command == "stop":
+                self.stop()
+            elif command == "quit":
+                self.stop()
+                break
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake UCI engine for benchmarks.')
+    parser.add_argument('--info-rate', type=float, default=1000, help='info lines per second, 0 for unthrottled')
+    parser.add_argument('--max-depth', type=int, default=99, help='depth at which an infinite search idles')
+    parser.add_argument('--pv-length', type=int, default=12)
+    args = parser.parse_args()
+    FakeEngine(args.info_rate, args.max_depth, args.pv_length).run()
+
+
+if __name__ == '__main__':
+    main()
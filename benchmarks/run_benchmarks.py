@@ -0,0 +1,345 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import chess
+import chess.engine
+from PyQt6.QtCore import QT_VERSION_STR, QEvent, QPointF, Qt, QTimer
+from PyQt6.QtGui import QMouseEvent
+from PyQt6.QtWidgets import QApplication
+from qasync import QEventLoop
+
+from Ilmarinen.benchmarks.fake_uci_engine import fake_engine_command
+
+# Offscreen benchmarks for board rendering, engine output handling and the analysis loop.
+# Results are written as JSON so two runs can be compared:
+#
+#   python -m Ilmarinen.benchmarks.run_benchmarks -o before.json
+#   python -m Ilmarinen.benchmarks.run_benchmarks -o after.json --compare before.json
+
+# 1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 ... a Ruy Lopez long enough to step through
+GAME_MOVES = (
+    "e2e4 e7e5 g1f3 b8c6 f1b5 a7a6 b5a4 g8f6 e1g1 f8e7 f1e1 b7b5 a4b3 d7d6 c2c3 e8g8 h2h3 c6b8 d2d4 b8d7 "
+    "c3c4 c7c6 c4b5 a6b5 b1c3 c8b7 c1g5 b5b4 c3b1 h7h6 g5h4 c6c5 d4e5 f6e4 h4e7 d8e7 e5d6 e7f6 b1d2 e4d6 "
+    "d2c4 d6c4 b3c4 d7b6 d1e2 a8e8 e2d3 b6c4 d3c4"
+).split()
+
+
+def summarize(samples, unit='ms'):
+    samples = sorted(samples)
+    return {
+        "unit": unit,
+        "runs": len(samples),
+        "min": samples[0],
+        "median": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "max": samples[-1],
+    }
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+
+def mouse_event(kind, pos, buttons=Qt.MouseButton.LeftButton):
+    return QMouseEvent(kind, QPointF(pos), QPointF(pos), Qt.MouseButton.LeftButton, buttons, Qt.KeyboardModifier.NoModifier)
+
+
+def bench_board(app, repeat):
+    from Ilmarinen.chess_board_widget import ChessBoardWithControls, SQUARE_SIZE, piece_images
+
+    widget = ChessBoardWithControls()
+    widget.resize(800, 800)
+    widget.show()
+    app.processEvents()
+    chessboard = widget.chessboard
+    results = {}
+
+    def step_through_game():
+        chessboard.reset_board()
+        for move in GAME_MOVES:
+            chessboard.game_state.move_piece(move[:2], move[2:])
+            app.processEvents()
+
+    game = timed(step_through_game, repeat)
+    results["board.refresh_board.per_move"] = {
+        **game, **{key: game[key] / len(GAME_MOVES) for key in ("min", "median", "p95", "max")}}
+    results["board.flip_board"] = timed(chessboard.flip_board, repeat * 10)
+
+    def resize_drag():
+        for width in range(400, 1000, 20):
+            widget.resize(width, width)
+            app.processEvents()
+
+    results["board.resize_drag.30_steps"] = timed(resize_drag, repeat)
+
+    def redraw():
+        # a settled resize at a size the piece cache has not seen yet
+        piece_images._scaled.clear()
+        chessboard.piece_size = SQUARE_SIZE + 1
+        chessboard.redraw_board()
+
+    results["board.redraw_board"] = timed(redraw, repeat * 10)
+
+    def drag_piece():
+        # pick up the queen, 200 mouse moves across the board at a repaint per 16 events, drop it back
+        chessboard.mousePressEvent(mouse_event(QEvent.Type.MouseButtonPress, start))
+        for step in range(200):
+            chessboard.mouseMoveEvent(mouse_event(QEvent.Type.MouseMove, start + (end - start) * (step / 200)))
+            if step % 16 == 0:
+                app.processEvents()
+        chessboard.mouseReleaseEvent(mouse_event(QEvent.Type.MouseButtonRelease, start, Qt.MouseButton.NoButton))
+        app.processEvents()
+
+    chessboard.reset_board()
+    if chessboard.flipped:
+        chessboard.flip_board()
+    start = chessboard.mapFromScene(QPointF(3.5 * SQUARE_SIZE, 7.5 * SQUARE_SIZE))
+    end = chessboard.mapFromScene(QPointF(7.5 * SQUARE_SIZE, 0.5 * SQUARE_SIZE))
+    results["board.drag.200_mouse_moves"] = timed(drag_piece, repeat * 10)
+    widget.close()
+    return results
+
+
+def bench_board_wall(app, repeat, count=40):
+    from Ilmarinen.chess_board_widget import ChessBoardWithControls
+    from Ilmarinen.compact_board_widget import BoardWall
+
+    results = {}
+
+    def play_on_every_board(boards):
+        for move in GAME_MOVES[:10]:
+            for board in boards:
+                board.game_state.move_piece(move[:2], move[2:])
+            app.processEvents()
+        for board in boards:
+            board.game_state.reset()
+        app.processEvents()
+
+    def wall_of(make_board):
+        boards = [make_board() for _ in range(count)]
+        for board in boards:
+            board.resize(160, 160)
+            board.show()
+        app.processEvents()
+        return boards
+
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        wall = BoardWall(columns=8)
+        wall.resize(8 * 160, (count + 7) // 8 * 160)
+        compact = [wall.add_board() for _ in range(count)]
+        wall.show()
+        app.processEvents()
+        results[f"wall.compact.{count}_boards.10_moves"] = timed(lambda: play_on_every_board(compact), repeat)
+        wall.close()
+        standard = wall_of(ChessBoardWithControls)
+        results[f"wall.standard.{count}_boards.10_moves"] = timed(
+            lambda: play_on_every_board([widget.chessboard for widget in standard]), repeat)
+        for widget in standard:
+            widget.close()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return results
+
+
+def synthetic_infos(count, multipv):
+    board = chess.Board()
+    moves = list(board.legal_moves)
+    infos = []
+    for index in range(count):
+        slot = index % multipv + 1
+        infos.append({
+            "depth": index // multipv + 1,
+            "seldepth": index // multipv + 5,
+            "multipv": slot,
+            "score": chess.engine.PovScore(chess.engine.Cp(30 - slot), chess.WHITE),
+            "pv": moves[slot - 1:slot + 7],
+        })
+    return infos
+
+
+def bench_output(app, repeat):
+    from Ilmarinen.analysis_info import parse_info
+    from Ilmarinen.chess_engine_widget import ChessEngineWidget
+
+    infos = synthetic_infos(5000, 5)
+    results = {"output.parse_info.5000": timed(lambda: [parse_info(info) for info in infos], repeat)}
+
+    widget = ChessEngineWidget(None)
+    widget.num_lines = 5
+    widget.show()
+
+    def handle_flood():
+        widget.show_cached_analysis(0)
+        for index, info in enumerate(infos):
+            widget.update_results(info, cache=False)
+            # what analysis_update_timer does at 15 Hz, here once per 100 messages
+            if index % 100 == 0:
+                widget.flush_results()
+                app.processEvents()
+        widget.flush_results()
+        app.processEvents()
+
+    results["output.update_results.5000_multipv5"] = timed(handle_flood, repeat)
+    widget.close()
+    return results
+
+
+def bench_analysis_loop(app, loop, duration, info_rate, multipv):
+    from Ilmarinen.chess_board_widget import ChessBoardWithControls
+    from Ilmarinen.chess_engine_widget import ChessEngineWidget
+
+    board_widget = ChessBoardWithControls()
+    engine_widget = ChessEngineWidget(None)
+    engine_widget.engine_path = fake_engine_command(info_rate)
+    engine_widget.linked_board_widget = board_widget.chessboard
+    board_widget.chessboard.game_state.subscribe(engine_widget.on_position_changed)
+    engine_widget.num_lines = multipv
+    engine_widget.analysis_cache.max_positions = 0
+    board_widget.show()
+    engine_widget.show()
+
+    handled = [0]
+    update_results = engine_widget.update_results
+
+    def counting_update_results(info, cache=True):
+        handled[0] += 1
+        update_results(info, cache)
+
+    engine_widget.update_results = counting_update_results
+
+    # UI latency: how late a 5 ms timer fires while engine output is being handled
+    lateness = []
+    last_tick = [time.perf_counter()]
+
+    def tick():
+        now = time.perf_counter()
+        lateness.append(max(0.0, (now - last_tick[0]) * 1000 - 5))
+        last_tick[0] = now
+
+    ticker = QTimer()
+    ticker.setInterval(5)
+    ticker.timeout.connect(tick)
+
+    async def scenario():
+        engine_widget.analysis_button.setText("Start analysis")
+        engine_widget.analysis_button.setEnabled(True)
+        engine_widget.toggle_analysis()
+        # let the engine start before measuring
+        await asyncio.sleep(1.0)
+        handled[0] = 0
+        last_tick[0] = time.perf_counter()
+        ticker.start()
+        started = time.perf_counter()
+        await asyncio.sleep(duration)
+        elapsed = time.perf_counter() - started
+        ticker.stop()
+        messages = handled[0]
+        # latency from a move on the board to the first info of the new search
+        move_latency = []
+        for move in GAME_MOVES[:10]:
+            handled[0] = 0
+            moved = time.perf_counter()
+            board_widget.chessboard.game_state.move_piece(move[:2], move[2:])
+            while handled[0] == 0:
+                await asyncio.sleep(0.001)
+            move_latency.append((time.perf_counter() - moved) * 1000)
+        engine_widget.toggle_analysis()
+        await asyncio.sleep(0.2)
+        return messages / elapsed, move_latency
+
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        throughput, move_latency = loop.run_until_complete(scenario())
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    name = f"analysis.rate{info_rate}_multipv{multipv}"
+    return {
+        f"{name}.info_messages_per_second": {"unit": "msg/s", "runs": 1, "median": throughput},
+        f"{name}.ui_timer_lateness": summarize(lateness or [0.0]),
+        f"{name}.move_to_first_info": summarize(move_latency),
+    }
+
+
+def compare(results, baseline, threshold, noise_floor=0.05):
+    # Lower is better for timings, higher for throughput; returns the regressed benchmarks.
+    # Differences below noise_floor (in the benchmark's unit) are never reported.
+    regressions = []
+    print(f"{'benchmark':60} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in sorted(results.items()):
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:60} {'-':>12} {result['median']:12.3f}")
+            continue
+        change = (result['median'] - before['median']) / before['median'] if before['median'] else 0.0
+        worse = -change if result['unit'] == 'msg/s' else change
+        significant = abs(result['median'] - before['median']) >= noise_floor
+        flag = '  REGRESSION' if worse > threshold and significant else ''
+        print(f"{name:60} {before['median']:12.3f} {result['median']:12.3f} {change:+8.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the offscreen benchmark suite.')
+    parser.add_argument('-o', '--output', help='write results to this JSON file')
+    parser.add_argument('--compare', metavar='BASELINE', help='compare against an earlier results file')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown reported as a regression')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds per analysis loop scenario')
+    parser.add_argument('--skip-engine', action='store_true', help='skip the scenarios that run the fake engine')
+    args = parser.parse_args()
+
+    app = QApplication([])
+    loop = QEventLoop(app)
+    asyncio.set_event_loop(loop)
+
+    results = {}
+    results.update(bench_board(app, args.repeat))
+    results.update(bench_board_wall(app, args.repeat))
+    results.update(bench_output(app, args.repeat))
+    if not args.skip_engine:
+        for info_rate, multipv in ((1000, 1), (5000, 5)):
+            results.update(bench_analysis_loop(app, loop, args.duration, info_rate, multipv))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "qt": QT_VERSION_STR,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        sys.exit(1 if regressions else 0)
+    for name, result in sorted(results.items()):
+        print(f"{name:60} {result['median']:12.3f} {result['unit']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,73 @@
 from itertools import product
 
 from PyQt6.QtWidgets import QApplication, QGraphicsView, QGraphicsScene, QGraphicsRectItem, QGridLayout, QWidget, \
-    QPushButton, QGraphicsPixmapItem, QGraphicsItem
-from PyQt6.QtGui import QColor, QPen, QPixmap
-from PyQt6.QtCore import Qt , QRectF
+    QPushButton, QGraphicsPixmapItem, QGraphicsItem, QFileDialog, QMessageBox, QGraphicsEllipseItem, QMenu
+from PyQt6.QtGui import QColor, QPen, QPixmap, QPainter, QIcon, QCursor
+from PyQt6.QtCore import Qt , QRectF, QTimer
 import sys, os
 import chess
 from uuid import uuid4
 
-class GameState:
-    def __init__(self):
-        self.board = chess.Board()
+from Ilmarinen.game_state import GameState
 
-    def move_piece(self, start_square, end_square):
-        print(f'Attempting move {start_square+end_square}')
-        try:
-            move = chess.Move.from_uci(start_square + end_square)
-        except chess.InvalidMoveError:
-            return False
-        if move in self.board.legal_moves:
-            # print(f"Making move {move}")
-            self.board.push(move)
-            return True
-        return False
+PIECE_FILES = {
+    'R': 'white-rook.png',
+    'N': 'white-knight.png',
+    'B': 'white-bishop.png',
+    'Q': 'white-queen.png',
+    'K': 'white-king.png',
+    'P': 'white-pawn.png',
+    'r': 'black-rook.png',
+    'n': 'black-knight.png',
+    'b': 'black-bishop.png',
+    'q': 'black-queen.png',
+    'k': 'black-king.png',
+    'p': 'black-pawn.png'
+}
+
+
+class PieceImageCache:
+    # Decodes every piece PNG once and keeps scaled copies keyed by (symbol, width, height),
+    # so refreshing a board never touches the disk after the first paint.
+    max_scaled = 12 * 8
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._sources = {}
+        self._scaled = {}
+
+    def source(self, symbol):
+        pixmap = self._sources.get(symbol)
+        if pixmap is None:
+            if self.directory is None:
+                self.directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'chessboard')
+            pixmap = QPixmap(os.path.join(self.directory, PIECE_FILES[symbol]))
+            self._sources[symbol] = pixmap
+        return pixmap
+
+    def scaled(self, symbol, width, height):
+        key = (symbol, width, height)
+        pixmap = self._scaled.get(key)
+        if pixmap is None:
+            # sizes left over from earlier resizes are dropped wholesale, they are cheap to rebuild
+            if len(self._scaled) >= self.max_scaled:
+                self._scaled.clear()
+            pixmap = self.source(symbol).scaled(
+                width, height,
+                Qt.AspectRatioMode.KeepAspectRatio,
+                Qt.TransformationMode.SmoothTransformation
+            )
+            self._scaled[key] = pixmap
+        return pixmap
+
+
+piece_images = PieceImageCache()
+
+# The board is laid out once in fixed scene coordinates; the view transform does the sizing.
+SQUARE_SIZE = 100
+# stacking of the scene items: squares, square highlights, pieces, move targets, the dragged piece
+HIGHLIGHT_Z, PIECE_Z, TARGET_Z, DRAG_Z = 1, 2, 3, 4
+PROMOTION_PIECES = (chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT)
 
 
 class ChessSquare(QGraphicsRectItem):
@@ -40,38 +85,68 @@ class Chessboard(QGraphicsView):
         self.flipped = False
         self.setResizeAnchor(QGraphicsView.ViewportAnchor.AnchorViewCenter)
         self.game_state = GameState()
+        self.game_state.subscribe(self.on_position_changed)
         self.scene = QGraphicsScene(self)
         self.setScene(self.scene)
-        cbp = os.path.join(os.getcwd(), 'resources', 'chessboard' + os.sep)
-        self.piece_translation = {
-            'R': cbp + 'white-rook.png',
-            'N': cbp + 'white-knight.png',
-            'B': cbp + 'white-bishop.png',
-            'Q': cbp + 'white-queen.png',
-            'K': cbp + 'white-king.png',
-            'P': cbp + 'white-pawn.png',
-            'r': cbp + 'black-rook.png',
-            'n': cbp + 'black-knight.png',
-            'b': cbp + 'black-bishop.png',
-            'q': cbp + 'black-queen.png',
-            'k': cbp + 'black-king.png',
-            'p': cbp + 'black-pawn.png'
-        }
-
+        self.scene.setSceneRect(QRectF(0, 0, 8 * SQUARE_SIZE, 8 * SQUARE_SIZE))
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        # While the user drags the window edge only the view transform changes,
+        # pieces are re-rasterized at the final size once resizing settles.
+        self.resize_settle_timer = QTimer(self)
+        self.resize_settle_timer.setSingleShot(True)
+        self.resize_settle_timer.setInterval(150)
+        self.resize_settle_timer.timeout.connect(self.redraw_board)
+        # size in device pixels the piece pixmaps are currently rasterized at
+        self.piece_size = SQUARE_SIZE
+        # Mouse input: the selected chess square and its {to square: [moves]} from the game
+        # state's per-position index, so presses, drags and drops never generate moves
         self.selected_square = None
+        self.selection_targets = {}
+        self.selection_is_premove = False
+        # the piece item following the mouse and the square it was picked up from
+        self.drag_item = None
+        self.drag_origin = None
+        # (node it waits on, from square, to square, promotion), played once the opponent has moved
+        self.premove = None
         self.squares = [[None for _ in range(8)] for _ in range(8)]
         self.pieces = [[None for _ in range(8)] for _ in range(8)]
+        # piece map (chess square -> chess.Piece) currently shown in the scene
+        self.shown_pieces = {}
+        # arrow keys step through the game tree, up/down switch between variations
+        self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
+        self.navigation_keys = {
+            Qt.Key.Key_Left: self.game_state.go_back,
+            Qt.Key.Key_Right: self.game_state.go_forward,
+            Qt.Key.Key_Home: self.game_state.go_to_start,
+            Qt.Key.Key_End: self.game_state.go_to_end,
+            Qt.Key.Key_Up: self.game_state.previous_variation,
+            Qt.Key.Key_Down: self.game_state.next_variation,
+        }
         self.draw_board()
+        self.create_markers()
         # self.flip_board()
 
     def resizeEvent(self, event):
-        self.setSceneRect(QRectF(self.viewport().rect()))
-        self.redraw_board()
+        self.fitInView(self.scene.sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
+        self.resize_settle_timer.start()
         super().resizeEvent(event)
 
     def reset_board(self):
-        self.game_state = GameState()
+        self.game_state.reset()
+
+    def on_position_changed(self, version):
+        if self.selected_square is not None:
+            piece = self.game_state.board.piece_at(self.selected_square)
+            if piece is not None and piece == self.shown_pieces.get(self.selected_square):
+                # the selected piece is still there, e.g. the opponent moved while it was being dragged
+                self.select(self.selected_square)
+            else:
+                self.end_drag()
+                self.clear_selection()
         self.refresh_board()
+        self.check_premove()
 
     def flip_board(self):
         self.flipped = not self.flipped
@@ -80,56 +155,247 @@ class Chessboard(QGraphicsView):
             square = self.squares[row][col]
             old_name = square.square_name
             square.square_name = chr(ord('h') - ord(old_name[0]) + ord('a')) + str(8 - int(old_name[1]) + 1)
-        self.refresh_board()
+        self.end_drag()
+        self.clear_selection()
+        self.refresh_board(full=True)
+        self.show_premove()
+
+    def keyPressEvent(self, event):
+        step = self.navigation_keys.get(event.key())
+        if step is None:
+            super().keyPressEvent(event)
+            return
+        self.end_drag()
+        self.clear_selection()
+        step()
+
+    def square_at(self, pos):
+        # chess square under a viewport position, None outside the board
+        point = self.mapToScene(pos)
+        i, j = int(point.x() // SQUARE_SIZE), int(point.y() // SQUARE_SIZE)
+        if not (0 <= i < 8 and 0 <= j < 8):
+            return None
+        return chess.square(7 - i, j) if self.flipped else chess.square(i, 7 - j)
 
     def mousePressEvent(self, event):
-        item = self.itemAt(event.pos())
-        if isinstance(item, QGraphicsPixmapItem):
-            square = item.square
+        if event.button() == Qt.MouseButton.RightButton:
+            # right click drops the selection and any premove
+            self.end_drag()
+            self.clear_selection()
+            self.set_premove(None)
+            return
+        if event.button() != Qt.MouseButton.LeftButton:
+            super().mousePressEvent(event)
+            return
+        square = self.square_at(event.position().toPoint())
+        if square is not None and self.selected_square is not None and square in self.selection_targets:
+            # second click of a click-click move
+            self.play_selected(square)
+            return
+        if square is None or not self.select(square):
+            self.clear_selection()
+            return
+        i, j = self.square_coordinates(square)
+        self.drag_item = self.pieces[i][j]
+        self.drag_origin = square
+        self.drag_item.setZValue(DRAG_Z)
+        self.drag_to(event.position().toPoint())
+
+    def mouseMoveEvent(self, event):
+        # Runs at the mouse event rate while dragging, so it only moves the piece item
+        if self.drag_item is not None:
+            self.drag_to(event.position().toPoint())
         else:
-            square = item
-        if isinstance(square, ChessSquare):
-            # print(f"Entered mouse press event with {square.square_name}")
-            # print(f"Currently selected is {self.selected_square}")
-            if self.selected_square is None:
-                # piece = self.game_state.board.piece_at(chess.square(square.coordinates[0], 7 - square.coordinates[1]))
-                piece = self.game_state.board.piece_at(chess.parse_square(square.square_name))
-                if piece is not None:
-                    self.selected_square = square
+            super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if self.drag_item is None or event.button() != Qt.MouseButton.LeftButton:
+            super().mouseReleaseEvent(event)
+            return
+        square = self.square_at(event.position().toPoint())
+        if square in self.selection_targets:
+            self.play_selected(square)
+        elif square != self.drag_origin:
+            self.clear_selection()
+        # a release on the picked up square leaves it selected for a click-click move
+        self.end_drag()
+
+    def drag_to(self, pos):
+        point = self.mapToScene(pos)
+        self.drag_item.setPos(point.x() - SQUARE_SIZE / 2, point.y() - SQUARE_SIZE / 2)
+
+    def end_drag(self):
+        # puts the dragged piece back on its square; a played move replaces it on the next refresh
+        if self.drag_item is not None:
+            i, j = self.square_coordinates(self.drag_origin)
+            self.drag_item.setPos(i * SQUARE_SIZE, j * SQUARE_SIZE)
+            self.drag_item.setZValue(PIECE_Z)
+        self.drag_item = None
+        self.drag_origin = None
+
+    def select(self, square):
+        # Selects the piece on square and shows where it can go: its legal moves when its side is
+        # to move, otherwise its premoves. Returns False if there is no piece to select.
+        board = self.game_state.board
+        piece = board.piece_at(square)
+        if piece is None:
+            return False
+        self.selection_is_premove = piece.color != board.turn
+        targets = self.game_state.premove_targets() if self.selection_is_premove else self.game_state.move_targets()
+        self.selected_square = square
+        self.selection_targets = targets.get(square, {})
+        self.show_square(self.selection_marker, square)
+        self.show_targets(self.selection_targets)
+        return True
+
+    def clear_selection(self):
+        self.selected_square = None
+        self.selection_targets = {}
+        self.selection_marker.hide()
+        self.show_targets({})
+
+    def play_selected(self, to_square):
+        from_square = self.selected_square
+        moves = self.selection_targets[to_square]
+        promotion = None
+        if moves[0].promotion:
+            promotion = self.ask_promotion(self.game_state.board.piece_at(from_square).color)
+            if promotion is None:
+                return
+        self.clear_selection()
+        if self.selection_is_premove:
+            self.set_premove((self.game_state.node, from_square, to_square, promotion))
+        else:
+            self.set_premove(None)
+            self.game_state.move_piece(from_square, to_square, promotion)
+
+    def ask_promotion(self, color):
+        menu = QMenu(self)
+        icon_size = max(16, self.piece_size // 2)
+        for piece_type in PROMOTION_PIECES:
+            symbol = chess.Piece(piece_type, color).symbol()
+            action = menu.addAction(QIcon(piece_images.scaled(symbol, icon_size, icon_size)),
+                                    chess.piece_name(piece_type).capitalize())
+            action.setData(piece_type)
+        chosen = menu.exec(QCursor.pos())
+        return chosen.data() if chosen is not None else None
+
+    def set_premove(self, premove):
+        self.premove = premove
+        self.show_premove()
+
+    def check_premove(self):
+        if self.premove is None:
+            return
+        node = self.premove[0]
+        if self.game_state.node.parent is node:
+            # the opponent replied in the premove's position; play it once this change is handled
+            QTimer.singleShot(0, self.play_premove)
+        elif self.game_state.node is not node:
+            self.set_premove(None)
+
+    def play_premove(self):
+        if self.premove is None or self.game_state.node.parent is not self.premove[0]:
+            return
+        _, from_square, to_square, promotion = self.premove
+        self.set_premove(None)
+        # dropped if the opponent's move made it illegal
+        self.game_state.move_piece(from_square, to_square, promotion)
+
+    def create_markers(self):
+        # Highlight items are created once and shown, hidden and moved as needed
+        no_pen = QPen()
+        no_pen.setStyle(Qt.PenStyle.NoPen)
+        self.selection_marker = QGraphicsRectItem(0, 0, SQUARE_SIZE, SQUARE_SIZE)
+        self.selection_marker.setBrush(QColor(255, 215, 0, 110))
+        self.premove_markers = [QGraphicsRectItem(0, 0, SQUARE_SIZE, SQUARE_SIZE) for _ in range(2)]
+        for marker in [self.selection_marker] + self.premove_markers:
+            if marker is not self.selection_marker:
+                marker.setBrush(QColor(200, 60, 60, 110))
+            marker.setPen(no_pen)
+            marker.setZValue(HIGHLIGHT_Z)
+            marker.hide()
+            self.scene.addItem(marker)
+        # a queen in the middle of an empty board has 27 moves, more than any other piece
+        self.target_markers = []
+        diameter = SQUARE_SIZE * 0.3
+        for _ in range(27):
+            marker = QGraphicsEllipseItem(0, 0, diameter, diameter)
+            marker.setBrush(QColor(20, 85, 30, 130))
+            marker.setPen(no_pen)
+            marker.setZValue(TARGET_Z)
+            marker.hide()
+            self.scene.addItem(marker)
+            self.target_markers.append(marker)
+
+    def show_square(self, marker, square):
+        i, j = self.square_coordinates(square)
+        marker.setPos(i * SQUARE_SIZE, j * SQUARE_SIZE)
+        marker.show()
+
+    def show_targets(self, targets):
+        offset = SQUARE_SIZE * 0.35
+        squares = list(targets)
+        for index, marker in enumerate(self.target_markers):
+            if index < len(squares):
+                i, j = self.square_coordinates(squares[index])
+                marker.setPos(i * SQUARE_SIZE + offset, j * SQUARE_SIZE + offset)
+                marker.show()
+            elif marker.isVisible():
+                marker.hide()
             else:
-                if self.game_state.move_piece(self.selected_square.square_name, square.square_name):
-                    self.refresh_board()
-                    self.selected_square = None
-                else:
-                    self.selected_square = None
-        super().mousePressEvent(event)
-
-    def refresh_board(self):
-        # print('-----------'*3)
-        for i in range(8):
-            for j in range(8):
-                # remove the previous piece on this square if it exists
-                if self.pieces[i][j] is not None:
-                    self.scene.removeItem(self.pieces[i][j])
-                    self.pieces[i][j] = None
-
-                flip_adjusted_j = j if self.flipped else 7 - j
-                flip_adjusted_i = 7-i if self.flipped else i
-                piece = self.game_state.board.piece_at(chess.square(flip_adjusted_i, flip_adjusted_j))
-                # print(f"I'm at {i} {j} and got piece {piece}")
-                if piece is not None:
-                    # print(f'At position {i} {j} there is {piece}')
-                    # print(f'Trying to get piece {piece} at square {i}x{j}')
-                    pixmap = QPixmap(self.piece_translation[str(piece)])
-                    pixmap_item = QGraphicsPixmapItem(pixmap.scaled(
-                        int(self.squares[i][j].rect().width()),
-                        int(self.squares[i][j].rect().height()),
-                        Qt.AspectRatioMode.KeepAspectRatio
-                    ))
-                    pixmap_item.square = self.squares[i][j]
-                    pixmap_item.setPos(self.squares[i][j].rect().left(), self.squares[i][j].rect().top())
-                    self.scene.addItem(pixmap_item)
-                    self.pieces[i][j] = pixmap_item
+                break
+
+    def show_premove(self):
+        if self.premove is None:
+            for marker in self.premove_markers:
+                marker.hide()
+            return
+        for marker, square in zip(self.premove_markers, self.premove[1:3]):
+            self.show_square(marker, square)
+
+    def square_coordinates(self, square):
+        # inverse of the (i, j) -> chess square mapping used by the scene
+        file, rank = chess.square_file(square), chess.square_rank(square)
+        return (7 - file, rank) if self.flipped else (file, 7 - rank)
+
+    def clear_pieces(self):
+        for i, j in product(range(8), repeat=2):
+            if self.pieces[i][j] is not None:
+                self.scene.removeItem(self.pieces[i][j])
+                self.pieces[i][j] = None
+        self.shown_pieces = {}
+
+    def refresh_board(self, full=False):
+        # Only squares whose piece differs from what is currently shown are touched.
+        # A full refresh is needed when the board orientation changed.
+        if full:
+            self.clear_pieces()
+        new_pieces = self.game_state.board.piece_map()
+        for square in self.shown_pieces.keys() | new_pieces.keys():
+            piece = new_pieces.get(square)
+            if self.shown_pieces.get(square) == piece:
+                continue
+            i, j = self.square_coordinates(square)
+            pixmap_item = self.pieces[i][j]
+            if piece is None:
+                self.scene.removeItem(pixmap_item)
+                self.pieces[i][j] = None
+                continue
+            rect = self.squares[i][j].rect()
+            pixmap = piece_images.scaled(piece.symbol(), self.piece_size, self.piece_size)
+            if pixmap_item is None:
+                pixmap_item = QGraphicsPixmapItem(pixmap)
+                pixmap_item.setTransformationMode(Qt.TransformationMode.SmoothTransformation)
+                pixmap_item.setScale(SQUARE_SIZE / self.piece_size)
+                pixmap_item.setZValue(PIECE_Z)
+                pixmap_item.square = self.squares[i][j]
+                pixmap_item.setPos(rect.left(), rect.top())
+                self.scene.addItem(pixmap_item)
+                self.pieces[i][j] = pixmap_item
+            else:
+                pixmap_item.setPixmap(pixmap)
+        self.shown_pieces = new_pieces
 
     def draw_board(self):
         # print('Entered draw board')
@@ -142,14 +408,11 @@ class Chessboard(QGraphicsView):
 
         self.squares = [[None for _ in range(8)] for _ in range(8)]
 
-        rect_width = self.width() // 8
-        rect_height = self.height() // 8
         colors = [QColor('white'), QColor('gray')]
 
         for i in range(8):
             for j in range(8):
-                # rect = QGraphicsRectItem(QRectF(i * rect_width, j * rect_height, rect_width, rect_height))
-                rect = ChessSquare(i, j, QRectF(i * rect_width, j * rect_height, rect_width, rect_height))
+                rect = ChessSquare(i, j, QRectF(i * SQUARE_SIZE, j * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
                 pen = QPen()
                 pen.setStyle(Qt.PenStyle.NoPen)
                 rect.setPen(pen)
@@ -158,21 +421,20 @@ class Chessboard(QGraphicsView):
                 self.squares[i][j] = rect
         # print("After draw_board()")
         # print(self.squares)
-        self.refresh_board()
+        self.refresh_board(full=True)
 
     def redraw_board(self):
-        rect_width = self.width() // 8
-        rect_height = self.height() // 8
-        for row in range(8):
-            for col in range(8):
-                square = self.squares[row][col]
-                self.scene.removeItem(square)
-        for row in range(8):
-            for col in range(8):
-                square = self.squares[row][col]
-                square.setRect(row*rect_width, col*rect_height, rect_width, rect_height)
-                self.scene.addItem(square)
-        self.refresh_board()
+        # Called once a resize has settled: squares keep their scene geometry,
+        # only the piece pixmaps are re-rasterized for the new on-screen size.
+        piece_size = max(1, round(SQUARE_SIZE * self.transform().m11()))
+        if piece_size == self.piece_size:
+            return
+        self.piece_size = piece_size
+        for square, piece in self.shown_pieces.items():
+            i, j = self.square_coordinates(square)
+            pixmap_item = self.pieces[i][j]
+            pixmap_item.setPixmap(piece_images.scaled(piece.symbol(), piece_size, piece_size))
+            pixmap_item.setScale(SQUARE_SIZE / piece_size)
 
 
 class ChessBoardWithControls(QWidget):
@@ -185,14 +447,44 @@ class ChessBoardWithControls(QWidget):
         self.reset_button.clicked.connect(self.chessboard.reset_board)
         self.flip_button = QPushButton("Flip board")
         self.flip_button.clicked.connect(self.chessboard.flip_board)
-        layout.addWidget(self.chessboard, 0, 0, 1, 2)
+        self.load_button = QPushButton("Load PGN...")
+        self.load_button.clicked.connect(self.load_pgn)
+        self.save_button = QPushButton("Save PGN...")
+        self.save_button.clicked.connect(self.save_pgn)
+        # shown by the main window, which does the closing
+        self.close_button = QPushButton("Close board")
+        self.close_button.hide()
+        layout.addWidget(self.chessboard, 0, 0, 1, 5)
         # layout.setRowStretch(0, 1)
         # layout.setColumnStretch(0, 1)
         layout.addWidget(self.reset_button, 1, 0, 1, 1)
         layout.addWidget(self.flip_button, 1, 1, 1, 1)
+        layout.addWidget(self.load_button, 1, 2, 1, 1)
+        layout.addWidget(self.save_button, 1, 3, 1, 1)
+        layout.addWidget(self.close_button, 1, 4, 1, 1)
         self.setLayout(layout)
         self.setWindowTitle('Chess Board')
 
+    def load_pgn(self):
+        filename, _ = QFileDialog.getOpenFileName(self, 'Load PGN', '', 'PGN files (*.pgn);;All files (*)')
+        if filename:
+            try:
+                loaded = self.chessboard.game_state.load_pgn(filename)
+            except (OSError, ValueError) as e:
+                print(f"Error loading {filename}: {str(e)}")
+                loaded = False
+            if not loaded:
+                QMessageBox.critical(self, "Error", f"No game could be loaded from {filename}")
+            self.chessboard.setFocus()
+
+    def save_pgn(self):
+        filename, _ = QFileDialog.getSaveFileName(self, 'Save PGN', 'game.pgn', 'PGN files (*.pgn)')
+        if filename:
+            try:
+                self.chessboard.game_state.save_pgn(filename)
+            except OSError as e:
+                QMessageBox.critical(self, "Error", f"Could not save {filename}: {str(e)}")
+
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
@@ -1,14 +1,29 @@
 import asyncio
+import os
 
 import chess
 import chess.engine
 from PyQt6.QtCore import QTimer
 from PyQt6.QtWidgets import QVBoxLayout, QPushButton, QTextEdit, QLabel, QMessageBox, QInputDialog, QFileDialog, \
-    QGridLayout
+    QGridLayout, QSpinBox, QTableView, QHeaderView, QToolButton, QMenu, QSizePolicy
 from qasync import asyncSlot
 
-from Ilmarinen.chess_board_widget import ChessBoardWithControls
+from Ilmarinen.analysis_cache import get_analysis_cache, position_key
+from Ilmarinen.analysis_info import parse_info
+from Ilmarinen.analysis_lines_model import AnalysisLinesModel
+from Ilmarinen.analysis_stats import AnalysisStats
 from Ilmarinen.custom_widget import CustomWidget
+from Ilmarinen.engine_scheduler import get_scheduler
+from Ilmarinen.engine_session import default_threads, default_hash_mb
+from Ilmarinen.engine_server import DEFAULT_PORT
+from Ilmarinen.local_knowledge import get_local_knowledge
+from Ilmarinen.remote_engine import RemoteEngineSession, is_remote
+from Ilmarinen.review_panel import ReviewPanel
+from Ilmarinen.stats_panel import PaintWatcher, StatsPanel
+
+
+# Threads a remote engine can be asked for
+REMOTE_MAX_THREADS = 1024
 
 
 class ChessEngineWidget(CustomWidget):
@@ -19,11 +34,26 @@ class ChessEngineWidget(CustomWidget):
         self.layout = QGridLayout(self)
         self.link_board_button = QPushButton('Link board')
         self.link_board_button.clicked.connect(self.link_board)
-        # Create QPushButton for browsing file
-        self.browse_button = QPushButton('Browse UCI engine...')
+        # Stops the engine and removes the panel, its engine goes back to the scheduler
+        self.close_button = QPushButton('Close')
+        self.close_button.clicked.connect(lambda: self.main_window.removeWidget(self))
+        # Create QToolButton for browsing file, its menu connects to an engine server instead
+        self.browse_button = QToolButton()
+        self.browse_button.setText('Browse UCI engine...')
         self.browse_button.clicked.connect(self.browse_file)
-        self.best_moves_text = QTextEdit()
-        self.analysis_text = QTextEdit()
+        self.browse_menu = QMenu(self.browse_button)
+        self.browse_menu.addAction('Connect to engine server...', self.connect_remote)
+        self.browse_button.setMenu(self.browse_menu)
+        self.browse_button.setPopupMode(QToolButton.ToolButtonPopupMode.MenuButtonPopup)
+        self.browse_button.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
+        # Latest info per multipv slot, repainted by analysis_update_timer rather than per engine message
+        self.lines_model = AnalysisLinesModel(self)
+        self.best_moves_view = QTableView()
+        self.best_moves_view.setModel(self.lines_model)
+        self.best_moves_view.verticalHeader().hide()
+        self.best_moves_view.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        self.best_moves_view.horizontalHeader().setStretchLastSection(True)
+        self.analysis_text = QLabel()
         # Create QPushButton for adding more best lines
         self.add_line_button = QPushButton("More lines", self)
         self.add_line_button.clicked.connect(self.add_line)
@@ -31,15 +61,64 @@ class ChessEngineWidget(CustomWidget):
         # Create QPushButton for removing best lines
         self.remove_line_button = QPushButton("Less lines", self)
         self.remove_line_button.clicked.connect(self.remove_line)
+        # Engine resources, applied to the running engine without restarting it
+        self.threads_label = QLabel('Threads')
+        self.threads_spin = QSpinBox()
+        self.threads_spin.setRange(1, os.cpu_count() or 1)
+        self.threads_spin.setValue(default_threads())
+        self.hash_label = QLabel('Hash (MB)')
+        self.hash_spin = QSpinBox()
+        self.hash_spin.setRange(1, 1 << 20)
+        self.hash_spin.setValue(default_hash_mb())
+        # typed values apply once editing is finished, not per keystroke: every Hash change clears the table
+        self.threads_spin.setKeyboardTracking(False)
+        self.hash_spin.setKeyboardTracking(False)
+        self.threads_spin.valueChanged.connect(self.interrupt_analysis)
+        self.hash_spin.valueChanged.connect(self.interrupt_analysis)
         # Create QLabel for showing the selected file
         self.file_label = QLabel('No file selected.')
         self.analysis_update_timer = QTimer()
-        self.analysis_update_timer.timeout.connect(self.update_results)
+        self.analysis_update_timer.setInterval(1000 // 15)
+        self.analysis_update_timer.timeout.connect(self.flush_results)
         # Create QPushButton for starting analysis
         self.analysis_button = QPushButton('Start analysis')
         self.analysis_button.clicked.connect(self.toggle_analysis)
         self.engine = None
         self.analysis_result = None
+        # Results are shared across widgets and runs, keyed by Zobrist hash of the position
+        self.analysis_cache = get_analysis_cache()
+        self.position_key = None
+        self.analysis_node = None
+        # Opening books and tablebases answer before the engine: a tablebase hit needs no search,
+        # a book hit lets the engine run at background priority
+        self.local_knowledge = get_local_knowledge()
+        self.known = None
+        self.known_for = None
+        self.knowledge_button = QToolButton()
+        self.knowledge_button.setText('Books/TB')
+        self.knowledge_menu = QMenu(self.knowledge_button)
+        self.knowledge_menu.addAction('Add opening book...', self.add_book)
+        self.knowledge_menu.addAction('Add tablebase directory...', self.add_tablebase_dir)
+        self.knowledge_menu.addAction('Clear books and tablebases', self.clear_knowledge)
+        self.knowledge_button.setMenu(self.knowledge_menu)
+        self.knowledge_button.setPopupMode(QToolButton.ToolButtonPopupMode.InstantPopup)
+        # Set whenever the running search has to be stopped or redirected: a new position on the
+        # linked board, changed engine settings or the stop button
+        self.analysis_wakeup = asyncio.Event()
+        self.current_analysis = None
+        # Engine processes and the thread budget are shared by all engine widgets
+        self.scheduler = get_scheduler()
+        # Optional latency/throughput instrumentation, off unless the stats panel is open
+        self.stats = AnalysisStats()
+        self.stats_panel = StatsPanel(self.stats)
+        self.stats_panel.hide()
+        self.stats_button = QPushButton('Stats')
+        self.stats_button.setCheckable(True)
+        self.stats_button.toggled.connect(self.toggle_stats)
+        self.paint_watchers = []
+        self.lag_task = None
+        # Background review of every position of the linked board's game
+        self.review_panel = ReviewPanel(self)
         # Create QTextEdit for showing the analysis results
         self.results_text = QTextEdit()
         self.should_stop_analysis = False
@@ -50,12 +129,21 @@ class ChessEngineWidget(CustomWidget):
         self.layout.addWidget(self.analysis_button, 0, 1)
         # self.layout.addWidget(self.results_text, 1, 0)
         self.layout.addWidget(self.link_board_button, 0, 2)
-        self.layout.addWidget(self.analysis_text, 2, 0, 1, 5)
-        self.layout.addWidget(self.best_moves_text, 3, 0, 1, 5)
+        self.layout.addWidget(self.analysis_text, 2, 0, 1, 4)
+        self.layout.addWidget(self.knowledge_button, 2, 4)
+        self.layout.addWidget(self.best_moves_view, 3, 0, 1, 6)
         self.layout.addWidget(self.add_line_button, 0, 3)
         self.layout.addWidget(self.remove_line_button, 0, 4)
+        self.layout.addWidget(self.close_button, 0, 5)
+        self.layout.addWidget(self.threads_label, 1, 0)
+        self.layout.addWidget(self.threads_spin, 1, 1)
+        self.layout.addWidget(self.hash_label, 1, 2)
+        self.layout.addWidget(self.hash_spin, 1, 3)
+        self.layout.addWidget(self.stats_button, 1, 4)
+        self.layout.addWidget(self.stats_panel, 4, 0, 1, 6)
+        self.layout.addWidget(self.review_panel, 5, 0, 1, 6)
         self.layout.setRowStretch(0, 1)
-        self.layout.setRowStretch(1, 5)
+        self.layout.setRowStretch(3, 5)
         # self.layout.setRowStretch(2, 5)
 
         # Set layout
@@ -69,45 +157,131 @@ class ChessEngineWidget(CustomWidget):
     async def start_analysis_async(self):
         print("Start analysis async")
         self.should_stop_analysis = False
-        try:
-            transport, engine = await chess.engine.popen_uci(self.engine_path)
-            self.board = self.linked_board_widget.game_state.board
-            starting_analysis_board = self.board.fen()
-            number_of_lines = self.num_lines
-            with await engine.analysis(self.board, multipv=self.num_lines) as analysis:
-                i = 0
-                async for info in analysis:
-                    # Check if board state has changed
-                    # print(self.linked_board_widget.game_state.board.fen())
-                    # print(self.board.fen())
-                    if starting_analysis_board != self.linked_board_widget.game_state.board.fen():
-                        print("board has changed")
-                        # If it has, stop the analysis
-                        self.should_stop_analysis = True
-                        # self.board = self.linked_board_widget.game_state.board
-
-                    if number_of_lines != self.num_lines:
-                        self.should_stop_analysis = True
-                    if self.should_stop_analysis:
-                        break
-                    score, pv = info.get("score"), info.get("pv")
-                    if score and pv:
-                        # print(score.score())
-                        self.update_results(info)
-                    i += 1
-                    if i > 1e5:
-                        break
-            await engine.quit()
-            # If the board state changed and analysis was stopped, restart with the new board state
-            if self.should_stop_analysis and starting_analysis_board != self.linked_board_widget.game_state.board.fen():
-                self.board = self.linked_board_widget.game_state.board
-                await self.start_analysis_async()
-            if number_of_lines != self.num_lines:
-                await self.start_analysis_async()
-        except Exception as e:
-            print(f"Error in start_analysis_async: {str(e)}")
+        self.analysis_update_timer.start()
+        while not self.should_stop_analysis:
+            self.analysis_wakeup.clear()
+            try:
+                game_state = self.linked_board_widget.game_state
+                # results are stored on the node the search started on, even after the user moved on
+                self.analysis_node = game_state.node
+                self.board = game_state.board_with_history()
+                key = position_key(self.board)
+                if key != self.position_key:
+                    self.show_cached_analysis(key, self.analysis_node)
+                number_of_lines, threads, hash_mb = self.analysis_settings()
+                if self.known_for != (key, number_of_lines):
+                    self.known_for = (key, number_of_lines)
+                    self.known = self.local_knowledge.lookup(self.board, number_of_lines)
+                    if self.known is not None:
+                        self.show_known(self.known[1])
+                source = self.known[0] if self.known is not None else None
+                if source == 'tablebase':
+                    # exact already, the engine process goes to other widgets until the position changes
+                    self.scheduler.yield_lease(self)
+                    await self.analysis_wakeup.wait()
+                    continue
+                # The scheduler decides which pooled engine process this widget searches on and
+                # with how many threads; it interrupts the search when that changes
+                lease = await self.scheduler.acquire(self, self.engine_path, threads, self.interrupt_analysis,
+                                                     priority=-1 if source == 'book' else 0)
+                if lease is None or self.analysis_wakeup.is_set():
+                    continue
+                # the engine process and its hash survive across positions and option changes,
+                # only the search is restarted
+                await lease.session.configure({"Threads": lease.threads,
+                                               "Hash": hash_mb if lease.hash_mb is None else min(hash_mb, lease.hash_mb)})
+                if self.analysis_wakeup.is_set():
+                    continue
+                with await lease.session.analysis(self.board, multipv=number_of_lines) as analysis:
+                    self.current_analysis = analysis
+                    if self.stats.enabled:
+                        self.stats.search_started()
+                    i = 0
+                    async for info in analysis:
+                        if self.stats.enabled:
+                            self.stats.info_received(info)
+                        if self.analysis_wakeup.is_set():
+                            break
+                        score, pv = info.get("score"), info.get("pv")
+                        if score and pv:
+                            self.update_results(info)
+                        i += 1
+                        if i > 1e5:
+                            break
+            except chess.engine.EngineTerminatedError as e:
+                # the session restarts the process on the next request
+                print(f"Engine terminated during analysis: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            except Exception as e:
+                print(f"Error in start_analysis_async: {str(e)}")
+                break
+            finally:
+                self.current_analysis = None
+                self.analysis_cache.flush()
+            # The search ended on its own, wait for the next position or settings change
+            await self.analysis_wakeup.wait()
+        self.scheduler.release(self)
+        self.analysis_update_timer.stop()
+        self.flush_results()
+
+    def interrupt_analysis(self, *args):
+        # Stops the running search right away, start_analysis_async then restarts it on the same process
+        self.analysis_wakeup.set()
+        if self.current_analysis is not None:
+            self.current_analysis.stop()
+
+    def stop_analysis(self):
+        self.analysis_button.setText("Start analysis")
+        self.should_stop_analysis = True
+        self.scheduler.release(self)
+        self.interrupt_analysis()
+
+    def on_position_changed(self, version):
+        if self.stats.enabled:
+            self.stats.position_changed()
+        self.interrupt_analysis()
 
+    def toggle_stats(self, enabled):
+        self.stats.enabled = enabled
+        self.stats_panel.setVisible(enabled)
+        if enabled:
+            self.install_paint_watchers()
+            # a quick off and on must not leave two loops sampling the lag
+            if self.lag_task is None or self.lag_task.done():
+                self.lag_task = asyncio.ensure_future(self.watch_event_loop_lag())
+        else:
+            self.remove_paint_watchers()
+            if self.lag_task is not None:
+                self.lag_task.cancel()
+                self.lag_task = None
+
+    def install_paint_watchers(self):
+        # event filters only exist while stats are collected
+        self.remove_paint_watchers()
+        self.paint_watchers = [
+            PaintWatcher(self.best_moves_view.viewport(), self.stats.results_painted),
+            PaintWatcher(self.analysis_text, self.stats.results_painted),
+        ]
+        if hasattr(self, 'linked_board_widget'):
+            self.paint_watchers.append(PaintWatcher(self.linked_board_widget.viewport(), self.stats.board_painted))
+
+    def remove_paint_watchers(self):
+        for watcher in self.paint_watchers:
+            watcher.remove()
+        self.paint_watchers = []
+
+    async def watch_event_loop_lag(self):
+        # how late a 100 ms sleep wakes up tells whether the asyncio/qasync side is starved
+        interval = 0.1
+        loop = asyncio.get_running_loop()
+        while self.stats.enabled:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            self.stats.event_loop_lag(max(0.0, loop.time() - started - interval) * 1000)
 
+    def analysis_settings(self):
+        return self.num_lines, self.threads_spin.value(), self.hash_spin.value()
 
     def toggle_analysis(self):
         print("Toggle analysis")  # Start of the method debug output
@@ -122,45 +296,84 @@ class ChessEngineWidget(CustomWidget):
                     QMessageBox.critical(self, "Error", "No board linked to this engine", QMessageBox.Ok)
                     return
 
-                asyncio.run(self.start_analysis_async())  # Debug message surrounding the call in question
+                self.start_analysis_async()  # asyncSlot schedules the coroutine on the qasync loop
                 print("Start analysis call completed")  # Completion of the call debug output
             else:
-                self.analysis_button.setText("Start analysis")
-                self.should_stop_analysis = True
+                self.stop_analysis()
         except Exception as e:
             pass
             # print(f"Error in toggle_analysis: {str(e)}")  # If any exceptions occur, print them
 
     def parse_info(self, info):
-        try:
-            pv = [str(move) for move in info["pv"]]
-            lines = " ".join(map(str, pv))
-            # get values from info or default to None if they are not existent
-            depth, seldepth = info.get("depth", None), info.get("seldepth", None)
-            score = info.get("score", None)
-            multipv = info.get("multipv", None)
-            return {"depth": f"{depth}/{seldepth}", "score": score, "lines": lines, "multipv": multipv}
-        except Exception as e:
-            print(str(e))
+        return parse_info(info)
+
+    def show_cached_analysis(self, key, node=None):
+        # Shows what is known about a position right away, the engine only replaces it with deeper results
+        self.position_key = key
+        self.lines_model.clear()
+        self.analysis_text.setText('')
+        slots = dict(self.analysis_cache.get(key) or {})
+        if node is not None:
+            # e.g. evaluations loaded from a PGN
+            for multipv, info in node.analysis.items():
+                if multipv not in slots or slots[multipv]["depth"] < info["depth"]:
+                    slots[multipv] = info
+        for multipv, info in sorted(slots.items()):
+            if multipv <= self.num_lines:
+                self.update_results(info, cache=False)
+        self.flush_results()
 
-    def update_results(self, result):
+    def show_known(self, infos):
+        self.lines_model.truncate(0)
+        for info in infos:
+            self.update_results(info, cache=False)
+        self.flush_results()
+
+    def add_book(self):
+        filename, _ = QFileDialog.getOpenFileName(self, 'Add opening book', '', 'Polyglot books (*.bin);;All files (*)')
+        if filename:
+            try:
+                self.local_knowledge.add_book(filename)
+            except OSError as e:
+                QMessageBox.critical(self, "Error", f"Could not open {filename}: {str(e)}")
+            self.knowledge_changed()
+
+    def add_tablebase_dir(self):
+        directory = QFileDialog.getExistingDirectory(self, 'Add Syzygy tablebase directory')
+        if directory:
+            self.local_knowledge.add_tablebase_dir(directory)
+            self.knowledge_changed()
+
+    def clear_knowledge(self):
+        self.local_knowledge.clear()
+        self.knowledge_changed()
+
+    def knowledge_changed(self):
+        # look the current position up again
+        self.known_for = None
+        self.interrupt_analysis()
+
+    def update_results(self, result, cache=True):
+        # Called for every engine info message, so it only records the latest info for its slot.
+        # Results shallower than the cached ones for this position are not shown.
+        if cache:
+            if self.analysis_node is not None:
+                self.analysis_node.store_analysis(result)
+            if not self.analysis_cache.put(self.position_key, result):
+                return
         parsed_result = self.parse_info(result)
-        analysis = f"Evaluation: {parsed_result.get('score')} Depth: {parsed_result.get('depth')}"
-        lines = parsed_result.get("lines")
-        multipv = parsed_result.get("multipv", 1)  # if multipv doesn't exist we default to 1 (first line)
-
-        if multipv == 1:
-            self.analysis_text.setText(analysis)
-
-        # Here we check if we already have the mv line already in our QTextEdit
-        # If we have we just update that line, if not we append a new line
-        current_best_moves = self.best_moves_text.toPlainText().split('\n')
-        if multipv <= len(current_best_moves):
-            current_best_moves[
-                multipv - 1] = f"{parsed_result.get('score').white()} {multipv}. {lines}"  # Remember that multipv is 1-indexed but Python lists are 0-indexed
-        else:
-            current_best_moves.append(f"{multipv}. {lines}")
-        self.best_moves_text.setText("\n".join(current_best_moves))
+        if parsed_result is not None:
+            self.lines_model.post(parsed_result)
+
+    def flush_results(self):
+        if not self.lines_model.flush():
+            return
+        if self.stats.enabled:
+            self.stats.results_flushed()
+        best_line = self.lines_model.best_line()
+        if best_line is not None:
+            score = best_line.get('score')
+            self.analysis_text.setText(f"Evaluation: {score if score is not None else '-'} Depth: {best_line.get('depth')}")
 
     def analysis_finished(self):
         # self.results_text.append("\nAnalysis finished!")
@@ -168,13 +381,13 @@ class ChessEngineWidget(CustomWidget):
 
     def add_line(self):
         self.num_lines += 1
+        self.interrupt_analysis()
 
     def remove_line(self):
         if self.num_lines > 1:
             self.num_lines -= 1
-            current_best_moves = self.best_moves_text.toPlainText().split('\n')
-            current_best_moves = current_best_moves[0:self.num_lines]
-            self.best_moves_text.setText("\n".join(current_best_moves))
+            self.lines_model.truncate(self.num_lines)
+            self.interrupt_analysis()
 
     def browse_file(self):
         file_dialog = QFileDialog()
@@ -185,8 +398,37 @@ class ChessEngineWidget(CustomWidget):
             self.file_label.setText(f'Selected engine: {filename}')
             # print(filename)
             self.engine_path = filename
+            self.threads_spin.setMaximum(os.cpu_count() or 1)
             self.analysis_button.setEnabled(True)
 
+    @asyncSlot()
+    async def connect_remote(self):
+        address, ok = QInputDialog.getText(self, "Connect to engine server", "Server address (tcp://host:port/engine):",
+                                           text=self.engine_path if is_remote(self.engine_path)
+                                           else f"tcp://localhost:{DEFAULT_PORT}/")
+        if not ok or not is_remote(address.strip()):
+            return
+        address = address.strip()
+        session = RemoteEngineSession(address)
+        if not session.engine_name:
+            # let the user pick one of the server's engines
+            try:
+                engines = await session.engines()
+            except (OSError, chess.engine.EngineError) as e:
+                QMessageBox.critical(self, "Error", f"Could not reach {address}: {str(e)}")
+                return
+            if not engines:
+                return
+            name, ok = QInputDialog.getItem(self, "Select engine", "Engines on the server", engines, editable=False)
+            if not ok:
+                return
+            address = address.rstrip('/') + '/' + name
+        self.file_label.setText(f'Selected engine: {address}')
+        self.engine_path = address
+        # the server's machine decides how many threads make sense, it caps them with --max-threads
+        self.threads_spin.setMaximum(REMOTE_MAX_THREADS)
+        self.analysis_button.setEnabled(True)
+
     def link_board(self):
         items, ok = QInputDialog.getItem(
             self, "Select target board", "Please select the board to link this engine to",
@@ -194,9 +436,15 @@ class ChessEngineWidget(CustomWidget):
         # print(items, ok)
         if ok and items:
             item_uuid = items.split(":")[-1]  # assuming uuid at the end
-            linked_board_widget = self.get_main_window().widgetDict[ChessBoardWithControls].get(item_uuid)
+            linked_board_widget = self.get_main_window().board_widgets().get(item_uuid)
             if linked_board_widget:
+                if hasattr(self, 'linked_board_widget'):
+                    self.linked_board_widget.game_state.unsubscribe(self.on_position_changed)
                 self.linked_board_widget = linked_board_widget.chessboard
+                self.linked_board_widget.game_state.subscribe(self.on_position_changed)
+                if self.stats.enabled:
+                    self.install_paint_watchers()
+                self.interrupt_analysis()
                 self.link_board_button.setText("Linked to Board " + str(items))
             else:
                 QMessageBox.critical(self, "Error",
@@ -210,4 +458,4 @@ class ChessEngineWidget(CustomWidget):
         # print(f'Getting main window widget dict')
         # # print(f'{self.get_main_window().widgetDict}')
         # print(f'{self.get_main_window().widgetDict[ChessBoardWithControls].keys()}')
-        return list(self.get_main_window().widgetDict[ChessBoardWithControls].keys())
\ No newline at end of file
+        return list(self.get_main_window().board_widgets().keys())
\ No newline at end of file
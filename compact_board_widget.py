@@ -0,0 +1,157 @@
+from uuid import uuid4
+
+import chess
+
+from PyQt6.QtCore import QRect, QRectF, Qt
+from PyQt6.QtGui import QColor, QPainter, QPixmap
+from PyQt6.QtWidgets import QGridLayout, QSizePolicy, QWidget
+
+from Ilmarinen.chess_board_widget import piece_images
+from Ilmarinen.game_state import GameState
+
+ATLAS_ORDER = 'PNBRQKpnbrqk'
+LIGHT_SQUARE = QColor('white')
+DARK_SQUARE = QColor('gray')
+
+_atlases = {}
+_backgrounds = {}
+
+
+def board_background(square_px):
+    # The empty board at one square size; the colouring is the same from either side
+    background = _backgrounds.get(square_px)
+    if background is None:
+        if len(_backgrounds) >= 8:
+            _backgrounds.clear()
+        background = QPixmap(square_px * 8, square_px * 8)
+        painter = QPainter(background)
+        for x in range(8):
+            for y in range(8):
+                painter.fillRect(x * square_px, y * square_px, square_px, square_px,
+                                 LIGHT_SQUARE if (x + y) % 2 == 0 else DARK_SQUARE)
+        painter.end()
+        _backgrounds[square_px] = background
+    return background
+
+
+def piece_atlas(square_px):
+    # All twelve pieces side by side at one square size, shared by every compact board of that size
+    atlas = _atlases.get(square_px)
+    if atlas is None:
+        if len(_atlases) >= 8:
+            _atlases.clear()
+        atlas = QPixmap(square_px * len(ATLAS_ORDER), square_px)
+        atlas.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(atlas)
+        for index, symbol in enumerate(ATLAS_ORDER):
+            piece = piece_images.scaled(symbol, square_px, square_px)
+            painter.drawPixmap(index * square_px + (square_px - piece.width()) // 2,
+                               (square_px - piece.height()) // 2, piece)
+        painter.end()
+        _atlases[square_px] = atlas
+    return atlas
+
+
+class CompactChessBoard(QWidget):
+    # A read-only board for walls of dozens of live games: no scene and no items, the whole
+    # position is painted into one cached pixmap from a shared piece atlas and only
+    # re-rendered when the position, the size or the orientation changes.
+    def __init__(self, game_state=None):
+        super().__init__()
+        self.uuid = str(uuid4())
+        self.game_state = game_state or GameState()
+        self.game_state.subscribe(self.on_position_changed)
+        self.flipped = False
+        self.position_pixmap = None
+        self.position_pixmap_key = None
+        self.setAttribute(Qt.WidgetAttribute.WA_OpaquePaintEvent)
+        self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+        self.setMinimumSize(64, 64)
+
+    @property
+    def chessboard(self):
+        # engine widgets link to `board_widget.chessboard.game_state`, like ChessBoardWithControls
+        return self
+
+    def viewport(self):
+        return self
+
+    def reset_board(self):
+        self.game_state.reset()
+
+    def flip_board(self):
+        self.flipped = not self.flipped
+        self.update()
+
+    def on_position_changed(self, version):
+        self.update()
+
+    def board_rect(self):
+        side = min(self.width(), self.height()) // 8 * 8
+        return QRect((self.width() - side) // 2, (self.height() - side) // 2, side, side)
+
+    def paintEvent(self, event):
+        board_rect = self.board_rect()
+        ratio = self.devicePixelRatioF()
+        square_px = max(1, round(board_rect.width() / 8 * ratio))
+        key = (self.game_state.version, square_px, self.flipped)
+        if key != self.position_pixmap_key:
+            self.position_pixmap = self.render_position(square_px)
+            self.position_pixmap.setDevicePixelRatio(ratio)
+            self.position_pixmap_key = key
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), self.palette().window())
+        painter.drawPixmap(QRectF(board_rect), self.position_pixmap, QRectF(self.position_pixmap.rect()))
+        painter.end()
+
+    def render_position(self, square_px):
+        pixmap = board_background(square_px).copy()
+        painter = QPainter(pixmap)
+        atlas = piece_atlas(square_px)
+        board = self.game_state.board
+        # straight from the piece bitboards, ATLAS_ORDER follows chess.PAWN..chess.KING per colour
+        for index, (color, piece_type) in enumerate((color, piece_type) for color in chess.COLORS
+                                                    for piece_type in chess.PIECE_TYPES):
+            source = QRect(index * square_px, 0, square_px, square_px)
+            for square in chess.scan_forward(board.pieces_mask(piece_type, color)):
+                file, rank = square & 7, square >> 3
+                x, y = (7 - file, rank) if self.flipped else (file, 7 - rank)
+                painter.drawPixmap(QRect(x * square_px, y * square_px, square_px, square_px), atlas, source)
+        painter.end()
+        return pixmap
+
+
+class BoardWall(QWidget):
+    # A grid of compact boards, e.g. one per game of a broadcast
+    def __init__(self, main_window=None, columns=8):
+        super().__init__()
+        self.uuid = str(uuid4())
+        self.main_window = main_window
+        self.columns = columns
+        self.boards = []
+        self.layout = QGridLayout(self)
+        self.layout.setSpacing(2)
+        self.setLayout(self.layout)
+
+    def add_board(self, game_state=None):
+        board = CompactChessBoard(game_state)
+        index = len(self.boards)
+        self.layout.addWidget(board, index // self.columns, index % self.columns)
+        self.boards.append(board)
+        if self.main_window is not None:
+            # registered like any other board so engines can be linked to it
+            self.main_window.registerWidget(board)
+        return board
+
+    def remove_boards(self, boards):
+        # the remaining boards close the gaps, in their order
+        for board in boards:
+            self.boards.remove(board)
+            self.layout.removeWidget(board)
+            if self.main_window is not None:
+                # stops the engines linked to it
+                self.main_window.removeWidget(board)
+            else:
+                board.deleteLater()
+        for index, board in enumerate(self.boards):
+            self.layout.addWidget(board, index // self.columns, index % self.columns)
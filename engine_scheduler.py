@@ -0,0 +1,251 @@
+import asyncio
+import time
+
+from Ilmarinen.engine_session import create_session, default_threads, default_hash_mb, session_key
+from Ilmarinen.remote_engine import is_remote
+
+
+class EngineLease:
+    # The right to search on `session` with `threads` threads until the scheduler revokes it.
+    # hash_mb is None on engine servers, their own limits apply there.
+    def __init__(self, session, threads, hash_mb):
+        self.session = session
+        self.threads = threads
+        self.hash_mb = hash_mb
+
+
+class ClientState:
+    def __init__(self, command, requested_threads, interrupt, priority):
+        self.command = command
+        self.requested_threads = requested_threads
+        self.interrupt = interrupt
+        self.priority = priority
+        self.waiter = None
+        # when the client got its lease or started waiting for one
+        self.since = time.monotonic()
+        self.expired = False
+        self.last_session = None
+        # registered but not searching, see yield_lease
+        self.paused = False
+
+
+class EngineScheduler:
+    # Owns a bounded pool of engine processes shared by all engine widgets, with a global
+    # thread budget. The focused client always gets an engine and the biggest share of the
+    # threads; background clients share the remaining engines, in time slices when there
+    # are more of them than engines. Clients are told to restart their search through their
+    # interrupt callback whenever their lease is revoked or its thread count changes.
+    # Engines on engine servers (tcp:// commands) do not use the desktop's processes, threads
+    # or memory: their clients always hold a lease with the threads they ask for.
+    def __init__(self, max_engines=None, thread_budget=None, hash_budget_mb=None, slice_seconds=5.0):
+        self.thread_budget = thread_budget or default_threads()
+        self.max_engines = max_engines or max(1, min(4, self.thread_budget))
+        self.hash_budget_mb = hash_budget_mb or default_hash_mb()
+        self.slice_seconds = slice_seconds
+        self.sessions = []
+        self.idle = []
+        self.clients = {}
+        self.leases = {}
+        self.focused = None
+        self.slice_handle = None
+
+    @property
+    def hash_per_engine_mb(self):
+        hash_mb = max(1, self.hash_budget_mb // self.max_engines)
+        return 1 << (hash_mb.bit_length() - 1)
+
+    async def acquire(self, client, command, requested_threads, interrupt, priority=0):
+        # Returns the client's lease, waiting for an engine if none is free. Returns None if the
+        # client released itself while waiting.
+        state = self.clients.get(client)
+        if state is not None and session_key(state.command) != session_key(command):
+            self.release(client)
+            state = None
+        if state is None:
+            state = self.clients[client] = ClientState(command, requested_threads, interrupt, priority)
+        elif state.paused:
+            state.paused = False
+            state.requested_threads = requested_threads
+            state.priority = priority
+            state.interrupt = interrupt
+            state.since = time.monotonic()
+        elif state.requested_threads != requested_threads or state.priority != priority:
+            state.requested_threads = requested_threads
+            state.priority = priority
+            state.interrupt = interrupt
+            self.rebalance()
+        lease = self.leases.get(client)
+        if lease is not None:
+            return lease
+        if state.waiter is None or state.waiter.done():
+            state.waiter = asyncio.get_running_loop().create_future()
+        self.rebalance()
+        return await state.waiter
+
+    def release(self, client):
+        # The client stopped analysing; its engine goes back to the pool. A focused client keeps
+        # the focus, so it is in front again when it restarts.
+        state = self.clients.pop(client, None)
+        if state is None:
+            return
+        if state.waiter is not None and not state.waiter.done():
+            state.waiter.set_result(None)
+        lease = self.leases.pop(client, None)
+        if lease is not None:
+            self.idle.append(lease.session)
+        self.rebalance()
+
+    def yield_lease(self, client):
+        # The client needs no engine for now (e.g. a tablebase position) but stays registered
+        # with its priority and focus; its next acquire takes an engine again
+        state = self.clients.get(client)
+        if state is None or state.paused:
+            return
+        state.paused = True
+        if state.waiter is not None and not state.waiter.done():
+            state.waiter.set_result(None)
+        state.waiter = None
+        lease = self.leases.pop(client, None)
+        if lease is not None:
+            self.idle.append(lease.session)
+        self.rebalance()
+
+    def forget(self, client):
+        # The client is gone for good
+        self.release(client)
+        if self.focused is client:
+            self.focused = None
+            self.rebalance()
+
+    def set_focus(self, client):
+        if client is not self.focused:
+            self.focused = client
+            self.rebalance()
+
+    def rebalance(self):
+        holders = self.choose_holders()
+        now = time.monotonic()
+        for client in list(self.leases):
+            if client not in holders:
+                lease = self.leases.pop(client)
+                self.idle.append(lease.session)
+                state = self.clients[client]
+                state.since = now
+                state.expired = False
+                state.waiter = None
+                state.interrupt()
+        threads = self.allocate_threads(holders)
+        for client in holders:
+            state = self.clients[client]
+            state.expired = False
+            lease = self.leases.get(client)
+            if lease is None:
+                hash_mb = None if is_remote(state.command) else self.hash_per_engine_mb
+                lease = self.leases[client] = EngineLease(self.take_session(state), threads[client], hash_mb)
+                state.last_session = lease.session
+                state.since = now
+                if state.waiter is not None and not state.waiter.done():
+                    state.waiter.set_result(lease)
+                else:
+                    # revoked and granted again before the client came back for it
+                    state.interrupt()
+            elif lease.threads != threads[client]:
+                lease.threads = threads[client]
+                state.interrupt()
+        self.schedule_time_slice()
+
+    def choose_holders(self):
+        slots = self.max_engines
+        holders = []
+        active = [client for client, state in self.clients.items() if not state.paused]
+        remote = [client for client in active if is_remote(self.clients[client].command)]
+        if remote:
+            # they take no local slot
+            holders.extend(remote)
+            active = [client for client in active if client not in remote]
+        if self.focused in active:
+            holders.append(self.focused)
+            slots -= 1
+        background = [client for client in active if client is not self.focused]
+        if len(background) <= slots:
+            return holders + background
+
+        def order(client):
+            state = self.clients[client]
+            # running clients keep their engine, then the longest waiting, clients whose slice ran out last
+            group = 2 if state.expired else 0 if client in self.leases else 1
+            return -state.priority, group, state.since
+
+        return holders + sorted(background, key=order)[:slots]
+
+    def allocate_threads(self, holders):
+        shares = {client: self.clients[client].requested_threads for client in holders
+                  if is_remote(self.clients[client].command)}
+        holders = [client for client in holders if client not in shares]
+        if not holders:
+            return shares
+        budget = self.thread_budget
+        if self.focused in holders and len(holders) > 1:
+            shares[self.focused] = max(1, budget // 2)
+            background = [client for client in holders if client is not self.focused]
+            each = max(1, (budget - shares[self.focused]) // len(background))
+            shares.update({client: each for client in background})
+        else:
+            each = max(1, budget // len(holders))
+            shares.update({client: each for client in holders})
+        return {client: min(share, self.clients[client].requested_threads) for client, share in shares.items()}
+
+    def take_session(self, state):
+        key = session_key(state.command)
+        # the client's previous engine still has its hash, any idle engine for the command is next best
+        for candidate in ([state.last_session] if state.last_session in self.idle else []) + self.idle:
+            if session_key(candidate.command) == key:
+                self.idle.remove(candidate)
+                return candidate
+        if is_remote(state.command):
+            # a connection to the server, not a process of our own
+            return create_session(state.command)
+        if len(self.sessions) >= self.max_engines:
+            # no room for another process: retire an idle engine of a different command
+            retired = next(session for session in self.idle if session in self.sessions)
+            self.idle.remove(retired)
+            self.sessions.remove(retired)
+            asyncio.ensure_future(retired.quit())
+        session = create_session(state.command)
+        self.sessions.append(session)
+        return session
+
+    def waiting_clients(self):
+        return sum(1 for client, state in self.clients.items() if not state.paused and client not in self.leases)
+
+    def schedule_time_slice(self):
+        waiting = self.waiting_clients() > 0
+        if waiting and self.slice_handle is None:
+            self.slice_handle = asyncio.get_running_loop().call_later(self.slice_seconds, self.time_slice)
+        elif not waiting and self.slice_handle is not None:
+            self.slice_handle.cancel()
+            self.slice_handle = None
+
+    def time_slice(self):
+        # background clients that used up their slice make room for the ones waiting
+        self.slice_handle = None
+        now = time.monotonic()
+        waiting = self.waiting_clients()
+        running = sorted((client for client in self.leases
+                          if client is not self.focused and not is_remote(self.clients[client].command)),
+                         key=lambda client: self.clients[client].since)
+        for client in running[:waiting]:
+            state = self.clients[client]
+            if now - state.since >= self.slice_seconds:
+                state.expired = True
+        self.rebalance()
+
+
+_scheduler = None
+
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = EngineScheduler()
+    return _scheduler
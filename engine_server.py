@@ -0,0 +1,303 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+
+import chess
+import chess.engine
+
+from Ilmarinen.engine_session import EngineSession
+
+# Serves local UCI engines over TCP, so one strong machine can analyse for many GUIs.
+# The protocol is JSON lines. A client sends
+#   {"id": 1, "op": "analysis", "engine": "sf", "fen": ..., "moves": [...], "multipv": 1,
+#    "limit": {"depth": 20} or null, "options": {"Threads": 8}, "game": "token"}
+#   {"id": 1, "op": "stop"}
+#   {"id": 2, "op": "engines"}
+# and gets {"id": 1, "info": {...}} messages followed by {"id": 1, "done": true}, or
+# {"id": 1, "error": "..."}. Any number of requests run at once on one connection. Engine
+# processes are pooled per engine and kept running between requests; a request goes to
+# the process that last searched the same client game, whose hash still holds it.
+
+DEFAULT_PORT = 9750
+INFO_FIELDS = ('depth', 'seldepth', 'multipv', 'nodes', 'nps', 'time', 'hashfull', 'tbhits')
+# search limits a client may set and their types, all non-negative
+LIMIT_FIELDS = {'depth': int, 'nodes': int, 'time': (int, float), 'mate': int}
+# options a client may set and their types; anything else (file paths like a debug log,
+# tablebase directories) stays under the control of whoever runs the server
+REMOTE_OPTIONS = {'Threads': int, 'Hash': int, 'UCI_Chess960': bool, 'UCI_ShowWDL': bool,
+                  'UCI_AnalyseMode': bool, 'Contempt': int}
+# infos are held back while this much is waiting to be sent to a client
+SEND_BUFFER_BYTES = 256 * 1024
+
+
+def valid_value(value, kind):
+    # isinstance with bool kept apart from int: JSON true is not a thread count
+    if isinstance(value, bool):
+        return kind is bool or (isinstance(kind, tuple) and bool in kind)
+    return isinstance(value, kind)
+
+
+def encode_info(info):
+    message = {field: info[field] for field in INFO_FIELDS if field in info}
+    if 'score' in info:
+        score = info['score']
+        message['score'] = {'turn': score.turn, 'cp': score.relative.score(), 'mate': score.relative.mate()}
+    if 'pv' in info:
+        message['pv'] = [move.uci() for move in info['pv']]
+    return message
+
+
+def decode_info(message):
+    info = {field: message[field] for field in INFO_FIELDS if field in message}
+    if 'score' in message:
+        score = message['score']
+        relative = chess.engine.Cp(score['cp']) if score['mate'] is None else chess.engine.Mate(score['mate'])
+        info['score'] = chess.engine.PovScore(relative, score['turn'])
+    if 'pv' in message:
+        info['pv'] = [chess.Move.from_uci(move) for move in message['pv']]
+    return info
+
+
+def encode_limit(limit):
+    if limit is None:
+        return None
+    return {name: getattr(limit, name) for name in ('depth', 'nodes', 'time', 'mate') if getattr(limit, name) is not None}
+
+
+class ClientConnection:
+    # The writing side of a client connection shared by its requests. Infos are only written
+    # while the transport buffer is below SEND_BUFFER_BYTES, a client that does not keep up
+    # gets the latest info of each line once it does.
+    def __init__(self, writer):
+        self.writer = writer
+
+    @property
+    def congested(self):
+        return self.writer.transport.get_write_buffer_size() > SEND_BUFFER_BYTES
+
+    def send(self, message):
+        if not self.writer.is_closing():
+            self.writer.write((json.dumps(message) + '\n').encode())
+
+    async def flush(self):
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+
+
+class EnginePool:
+    # Up to max_sessions processes of one engine command
+    def __init__(self, command, max_sessions):
+        self.command = command
+        self.max_sessions = max_sessions
+        self.sessions = []
+        self.idle = []
+        self.available = asyncio.Condition()
+
+    async def acquire(self, game):
+        async with self.available:
+            while True:
+                for session in self.idle:
+                    if session.client_game == game:
+                        self.idle.remove(session)
+                        return session
+                if len(self.sessions) < self.max_sessions:
+                    session = EngineSession(self.command)
+                    session.client_game = None
+                    self.sessions.append(session)
+                    return session
+                if self.idle:
+                    return self.idle.pop(0)
+                await self.available.wait()
+
+    async def release(self, session):
+        async with self.available:
+            self.idle.append(session)
+            self.available.notify()
+
+    async def quit(self):
+        await asyncio.gather(*(session.quit() for session in self.sessions), return_exceptions=True)
+
+
+class EngineServer:
+    def __init__(self, engines, max_sessions=2, max_threads=None, max_hash_mb=None):
+        # engines: {name: command}, the first one is used when a request names none
+        self.engines = engines
+        self.default_engine = next(iter(engines))
+        self.pools = {name: EnginePool(command, max_sessions) for name, command in engines.items()}
+        self.max_threads = max_threads or os.cpu_count() or 1
+        self.max_hash_mb = max_hash_mb
+        self.server = None
+        # connection handler task -> writer
+        self.connections = {}
+
+    async def start(self, host, port):
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        # clients see the connection close and fail their running analyses
+        for writer in self.connections.values():
+            writer.close()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        await asyncio.gather(*(pool.quit() for pool in self.pools.values()))
+
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        connection_task = asyncio.current_task()
+        self.connections[connection_task] = writer
+        client = ClientConnection(writer)
+        # request id -> (analysis task, stop event)
+        requests = {}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(message, dict):
+                    continue
+                op = message.get('op')
+                if op == 'analysis':
+                    stop = asyncio.Event()
+                    analysis_task = asyncio.ensure_future(self.run_analysis(message, stop, client))
+                    requests[message.get('id')] = analysis_task, stop
+                    analysis_task.add_done_callback(lambda _, request_id=message.get('id'): requests.pop(request_id, None))
+                elif op == 'stop':
+                    request = requests.get(message.get('id'))
+                    if request is not None:
+                        request[1].set()
+                elif op == 'engines':
+                    client.send({'id': message.get('id'), 'engines': list(self.engines), 'done': True})
+                else:
+                    client.send({'id': message.get('id'), 'error': f"unknown op {op}"})
+                await client.flush()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for _, stop in list(requests.values()):
+                stop.set()
+            await asyncio.gather(*(analysis_task for analysis_task, _ in list(requests.values())),
+                                 return_exceptions=True)
+            writer.close()
+            self.connections.pop(connection_task, None)
+            print(f"Connection from {peer} closed")
+
+    def parse_request(self, message):
+        # (pool, board, limit, options) of an analysis request, ValueError if it is malformed
+        pool = self.pools.get(message.get('engine') or self.default_engine)
+        if pool is None:
+            raise ValueError(f"unknown engine {message.get('engine')}")
+        board = chess.Board(message['fen'])
+        for move in message.get('moves') or []:
+            board.push_uci(move)
+        limit = message.get('limit')
+        if limit:
+            if not isinstance(limit, dict) or not all(
+                    name in LIMIT_FIELDS and valid_value(value, LIMIT_FIELDS[name]) and value >= 0
+                    for name, value in limit.items()):
+                raise ValueError(f"invalid limit {limit}")
+            limit = chess.engine.Limit(**limit)
+        multipv = message.get('multipv')
+        if multipv is not None and (not valid_value(multipv, int) or multipv < 1):
+            raise ValueError(f"invalid multipv {multipv}")
+        options = dict(message.get('options') or {})
+        for name, value in options.items():
+            if name not in REMOTE_OPTIONS or not valid_value(value, REMOTE_OPTIONS[name]):
+                raise ValueError(f"option {name} cannot be set remotely")
+        if 'Threads' in options:
+            options['Threads'] = min(options['Threads'], self.max_threads)
+        if 'Hash' in options and self.max_hash_mb:
+            options['Hash'] = min(options['Hash'], self.max_hash_mb)
+        return pool, board, limit or None, options
+
+    async def run_analysis(self, message, stop, client):
+        request_id = message.get('id')
+        pool = session = None
+        try:
+            try:
+                pool, board, limit, options = self.parse_request(message)
+            except (KeyError, TypeError, ValueError) as e:
+                client.send({'id': request_id, 'error': f"invalid request: {str(e)}"})
+                return
+            game = message.get('game')
+            session = await pool.acquire(game)
+            if session.client_game != game:
+                session.new_game()
+                session.client_game = game
+            await session.configure(options)
+            # the latest info per line not sent yet because the client is not keeping up
+            unsent = {}
+            with await session.analysis(board, limit, multipv=message.get('multipv')) as analysis:
+                stopper = asyncio.ensure_future(stop.wait())
+                stopper.add_done_callback(lambda _: analysis.stop())
+                try:
+                    async for info in analysis:
+                        unsent[info.get('multipv', 1)] = info
+                        if not client.congested:
+                            for pending in unsent.values():
+                                client.send({'id': request_id, 'info': encode_info(pending)})
+                            unsent.clear()
+                finally:
+                    stopper.cancel()
+            for pending in unsent.values():
+                client.send({'id': request_id, 'info': encode_info(pending)})
+            client.send({'id': request_id, 'done': True})
+        except chess.engine.EngineError as e:
+            client.send({'id': request_id, 'error': f"engine error: {str(e)}"})
+        except Exception as e:
+            print(f"Error in request {request_id}: {str(e)}")
+            client.send({'id': request_id, 'error': str(e)})
+        finally:
+            if session is not None:
+                await pool.release(session)
+        await client.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve local UCI engines to remote GUIs over TCP.')
+    parser.add_argument('--engine', action='append', required=True, metavar='NAME=COMMAND',
+                        help='an engine to serve, the first one is the default')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on, 0.0.0.0 for all interfaces')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--max-engines', type=int, default=2, help='engine processes per engine')
+    parser.add_argument('--max-threads', type=int, help='Threads limit per search')
+    parser.add_argument('--max-hash', type=int, help='Hash limit per engine process in MB')
+    args = parser.parse_args()
+
+    engines = {}
+    for engine in args.engine:
+        name, _, command = engine.partition('=')
+        if not command:
+            parser.error(f"--engine takes NAME=COMMAND, got {engine}")
+        engines[name] = command
+    server = EngineServer(engines, args.max_engines, args.max_threads, args.max_hash)
+
+    async def serve():
+        await server.start(args.host, args.port)
+        print(f"Serving {', '.join(engines)} on {args.host}:{args.port}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
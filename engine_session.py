@@ -0,0 +1,131 @@
+import asyncio
+import os
+
+import chess
+import chess.engine
+
+
+class EngineSession:
+    # A long-lived UCI engine process. The process is started once and reused for every
+    # position, so the engine keeps its hash table warm while the user steps through a game.
+    # If the process dies it is started again on the next request.
+    def __init__(self, command):
+        self.command = command
+        self.transport = None
+        self.engine = None
+        # python-chess sends ucinewgame whenever this object changes
+        self.game = object()
+        # options (Threads, Hash, ...) the process should run with, re-applied after a restart
+        self.options = {}
+        self._start_lock = asyncio.Lock()
+
+    @property
+    def alive(self):
+        return self.engine is not None and not self.engine.returncode.done()
+
+    async def start(self):
+        async with self._start_lock:
+            if not self.alive:
+                if self.engine is not None:
+                    print(f"Engine {self.command} terminated, restarting")
+                self.transport, self.engine = await chess.engine.popen_uci(self.command)
+                await self.engine.configure(self.supported_options(self.options))
+        return self.engine
+
+    def supported_options(self, options):
+        # drop options the engine does not know and clamp the rest to the engine's limits
+        supported = {}
+        for name, value in options.items():
+            option = self.engine.options.get(name)
+            if option is None:
+                continue
+            if option.min is not None:
+                value = max(option.min, value)
+            if option.max is not None:
+                value = min(option.max, value)
+            supported[option.name] = value
+        return supported
+
+    async def configure(self, options):
+        # Changes options on the running process. A running search is stopped by python-chess
+        # before the setoption is sent, the caller resumes with a new analysis afterwards.
+        self.options.update(options)
+        engine = await self.start()
+        await engine.configure(self.supported_options(options))
+
+    def new_game(self):
+        self.game = object()
+
+    async def analysis(self, board, limit=None, multipv=None):
+        # Returns a running chess.engine.AnalysisResult; leaving its context stops the search
+        # but keeps the process (and its hash) for the next position.
+        for attempt in range(2):
+            engine = await self.start()
+            try:
+                return await engine.analysis(board, limit, multipv=multipv, game=self.game)
+            except chess.engine.EngineTerminatedError:
+                if attempt:
+                    raise
+
+    async def analyse(self, board, limit, multipv=None):
+        for attempt in range(2):
+            engine = await self.start()
+            try:
+                return await engine.analyse(board, limit, multipv=multipv, game=self.game)
+            except chess.engine.EngineTerminatedError:
+                if attempt:
+                    raise
+
+    async def quit(self):
+        if self.alive:
+            try:
+                await self.engine.quit()
+            except chess.engine.EngineTerminatedError:
+                pass
+        self.engine = None
+        self.transport = None
+
+
+def default_threads():
+    # leave one core to the GUI
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def default_hash_mb():
+    # a quarter of the available memory, rounded down to a power of two
+    try:
+        available = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return 256
+    hash_mb = max(16, min(available // 4 // (1024 * 1024), 65536))
+    return 1 << (hash_mb.bit_length() - 1)
+
+
+def create_session(command):
+    # tcp://host:port/name is an engine on an engine server, anything else a local command
+    if isinstance(command, str) and command.startswith('tcp://'):
+        from Ilmarinen.remote_engine import RemoteEngineSession
+        return RemoteEngineSession(command)
+    return EngineSession(command)
+
+
+_sessions = {}
+
+
+def session_key(command):
+    return tuple(command) if isinstance(command, (list, tuple)) else command
+
+
+def get_session(command):
+    # One shared session per engine command
+    key = session_key(command)
+    session = _sessions.get(key)
+    if session is None:
+        session = _sessions[key] = create_session(command)
+    return session
+
+
+async def quit_all_sessions():
+    sessions = list(_sessions.values())
+    _sessions.clear()
+    await asyncio.gather(*(session.quit() for session in sessions), return_exceptions=True)
@@ -0,0 +1,130 @@
+import os
+
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt
+from PyQt6.QtWidgets import QFileDialog, QGridLayout, QHeaderView, QInputDialog, QLabel, QPushButton, QTableView
+
+from Ilmarinen.custom_widget import CustomWidget
+from Ilmarinen.position_index import PositionIndex
+
+
+class ExplorerMovesModel(QAbstractTableModel):
+    # The moves played in the shown position, as returned by PositionIndex.lookup
+    headers = ['Move', 'Games', 'White', 'Draw', 'Black']
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.moves = []
+
+    def set_moves(self, moves):
+        self.beginResetModel()
+        self.moves = moves
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.moves)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.headers[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+        entry = self.moves[index.row()]
+        column = index.column()
+        if column == 0:
+            return entry['san']
+        if column == 1:
+            return f"{entry['games']:,}"
+        share = entry[('white', 'draws', 'black')[column - 2]] / entry['games']
+        return f"{share:.0%}"
+
+
+class ExplorerWidget(CustomWidget):
+    # Move statistics of the linked board's position from a position index, looked up on every move
+    def __init__(self, main_window):
+        super().__init__()
+        self.main_window = main_window
+        self.index = None
+        self.linked_board_widget = None
+        self.open_button = QPushButton('Open index...')
+        self.open_button.clicked.connect(self.browse_index)
+        self.link_board_button = QPushButton('Link board')
+        self.link_board_button.clicked.connect(self.link_board)
+        self.summary_label = QLabel('No index opened.')
+        self.moves_model = ExplorerMovesModel(self)
+        self.moves_view = QTableView()
+        self.moves_view.setModel(self.moves_model)
+        self.moves_view.verticalHeader().hide()
+        self.moves_view.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        self.moves_view.horizontalHeader().setStretchLastSection(True)
+        # double click plays the move on the board
+        self.moves_view.doubleClicked.connect(self.play_move)
+        self.layout = QGridLayout(self)
+        self.layout.addWidget(self.open_button, 0, 0)
+        self.layout.addWidget(self.link_board_button, 0, 1)
+        self.layout.addWidget(self.summary_label, 1, 0, 1, 2)
+        self.layout.addWidget(self.moves_view, 2, 0, 1, 2)
+        self.layout.setRowStretch(2, 1)
+        self.setLayout(self.layout)
+        if os.environ.get('ILMARINEN_POSITION_INDEX'):
+            self.open_index(os.environ['ILMARINEN_POSITION_INDEX'])
+
+    def browse_index(self):
+        filename, _ = QFileDialog.getOpenFileName(self, 'Open position index')
+        if filename:
+            self.open_index(filename)
+
+    def open_index(self, path):
+        try:
+            index = PositionIndex(path)
+        except (OSError, ValueError) as e:
+            print(f"Error opening position index {path}: {str(e)}")
+            self.summary_label.setText(f'Could not open {os.path.basename(path)}.')
+            return
+        if self.index is not None:
+            self.index.close()
+        self.index = index
+        self.refresh()
+
+    def link_to(self, board_widget):
+        if self.linked_board_widget is not None:
+            self.linked_board_widget.game_state.unsubscribe(self.on_position_changed)
+        self.linked_board_widget = board_widget.chessboard
+        self.linked_board_widget.game_state.subscribe(self.on_position_changed)
+        self.refresh()
+
+    def unlink(self):
+        if self.linked_board_widget is not None:
+            self.linked_board_widget.game_state.unsubscribe(self.on_position_changed)
+        self.linked_board_widget = None
+        self.link_board_button.setText('Link board')
+        self.refresh()
+
+    def link_board(self):
+        boards = self.main_window.board_widgets()
+        item, ok = QInputDialog.getItem(self, "Select target board", "Please select the board to link the explorer to",
+                                        list(boards.keys()), editable=False)
+        if ok and item in boards:
+            self.link_to(boards[item])
+            self.link_board_button.setText("Linked to Board " + item)
+
+    def on_position_changed(self, version):
+        self.refresh()
+
+    def refresh(self):
+        if self.index is None or self.linked_board_widget is None:
+            self.moves_model.set_moves([])
+            return
+        moves = self.index.lookup(self.linked_board_widget.game_state.board)
+        games = sum(entry['games'] for entry in moves)
+        self.summary_label.setText(f"{games:,} games in {os.path.basename(self.index.path)}")
+        self.moves_model.set_moves(moves)
+
+    def play_move(self, model_index):
+        if self.linked_board_widget is not None and model_index.isValid():
+            self.linked_board_widget.game_state.push_moves([self.moves_model.moves[model_index.row()]['move']])
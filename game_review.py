@@ -0,0 +1,215 @@
+import asyncio
+
+import chess
+import chess.engine
+
+from Ilmarinen.analysis_cache import get_analysis_cache, position_key
+from Ilmarinen.engine_scheduler import get_scheduler
+
+# Loss in centipawns, from the point of view of the side that moved, for each mark
+MARKS = ((300, 'blunder'), (100, 'mistake'), (50, 'inaccuracy'))
+MATE_CP = 1000
+
+
+def white_cp(node):
+    # The node's best evaluation in centipawns from White's point of view, clamped for the graph
+    best = node.analysis.get(1)
+    if best is None:
+        return None
+    return max(-MATE_CP, min(MATE_CP, best["score"].white().score(mate_score=MATE_CP)))
+
+
+def review_marks(nodes):
+    # [(node, loss, mark)] for the moves of a line of nodes that lost enough to be marked
+    marks = []
+    for before, after in zip(nodes, nodes[1:]):
+        eval_before, eval_after = white_cp(before), white_cp(after)
+        if eval_before is None or eval_after is None:
+            continue
+        loss = eval_before - eval_after if before.board.turn == chess.WHITE else eval_after - eval_before
+        for threshold, mark in MARKS:
+            if loss >= threshold:
+                marks.append((after, loss, mark))
+                break
+    return marks
+
+
+def terminal_info(board, depth):
+    # Game over positions need no engine
+    if board.is_checkmate():
+        score = chess.engine.Mate(0)
+    else:
+        score = chess.engine.Cp(0)
+    return {"depth": depth, "seldepth": 0, "score": chess.engine.PovScore(score, board.turn), "pv": [], "multipv": 1}
+
+
+class ReviewWorker:
+    # One background search of a review, a client of the engine scheduler like an engine widget
+    def __init__(self, review):
+        self.review = review
+        self.next_node = None
+        self.analysis = None
+        self.interrupted = False
+
+    def interrupt(self):
+        self.interrupted = True
+        if self.analysis is not None:
+            self.analysis.stop()
+
+
+class GameReview:
+    # Evaluates every position of a game's main line to a fixed depth in the background.
+    # The workers are low priority scheduler clients, so they only get engines and threads
+    # that interactive analysis does not need. Each worker walks the game from the end
+    # towards the start, so the engine's hash already holds the continuation of the position
+    # it searches; an idle worker takes over the middle of the longest stretch not yet
+    # reviewed. prioritize() puts a position (the one on the board) in front of all others.
+    def __init__(self, root, engine_command, depth=16, workers=None, priority=-1, on_result=None, scheduler=None):
+        self.engine_command = engine_command
+        self.depth = depth
+        self.priority = priority
+        self.on_result = on_result
+        self.scheduler = scheduler or get_scheduler()
+        self.analysis_cache = get_analysis_cache()
+        self.nodes = root.mainline()
+        # node -> 'pending', 'running' or 'done'
+        self.state = {node: 'pending' for node in self.nodes}
+        self.urgent = []
+        # one engine stays free for interactive analysis; the workers ask for the whole thread
+        # budget between them and the scheduler cuts that down while others need threads
+        self.worker_count = workers or max(1, min(len(self.nodes), self.scheduler.max_engines - 1))
+        self.threads_per_worker = max(1, self.scheduler.thread_budget // self.worker_count)
+        self.workers = []
+        self.tasks = []
+        self.finished = asyncio.Event()
+
+    @property
+    def done_count(self):
+        return sum(1 for state in self.state.values() if state == 'done')
+
+    def start(self):
+        for node in self.nodes:
+            if self.reuse(node):
+                self.finish(node)
+        # each worker starts at the end of its own stretch of the game
+        stride = len(self.nodes) / self.worker_count
+        for index in range(self.worker_count):
+            worker = ReviewWorker(self)
+            worker.next_node = self.nodes[min(len(self.nodes) - 1, int(len(self.nodes) - 1 - index * stride))]
+            self.workers.append(worker)
+            self.tasks.append(asyncio.ensure_future(self.run_worker(worker)))
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        for worker in self.workers:
+            worker.interrupt()
+            self.scheduler.release(worker)
+        self.finished.set()
+
+    def prioritize(self, node):
+        # Reviews node next, also if it is not on the main line
+        if self.state.get(node) == 'done' or self.state.get(node) == 'running':
+            return
+        if node not in self.state and self.reuse(node):
+            self.state[node] = 'pending'
+            self.finish(node)
+            return
+        self.state[node] = 'pending'
+        if node in self.urgent:
+            self.urgent.remove(node)
+        self.urgent.insert(0, node)
+
+    def reuse(self, node):
+        # Takes a deep enough result from the node itself or the shared analysis cache
+        held = node.analysis.get(1)
+        if held is not None and held["depth"] >= self.depth:
+            return True
+        cached = (self.analysis_cache.get(position_key(node.board)) or {}).get(1)
+        if cached is not None and cached["depth"] >= self.depth:
+            node.store_analysis(cached)
+            return True
+        if node.board.is_game_over():
+            node.store_analysis(terminal_info(node.board, self.depth))
+            return True
+        return False
+
+    def take_node(self, worker):
+        while self.urgent:
+            node = self.urgent.pop(0)
+            if self.state.get(node) == 'pending':
+                return node
+        if self.state.get(worker.next_node) == 'pending':
+            return worker.next_node
+        # the middle of the longest stretch of pending positions
+        longest, run = [], []
+        for node in self.nodes:
+            if self.state[node] == 'pending':
+                run.append(node)
+                if len(run) > len(longest):
+                    longest = run
+            else:
+                run = []
+        return longest[len(longest) // 2] if longest else None
+
+    def finish(self, node):
+        self.state[node] = 'done'
+        if self.on_result is not None:
+            self.on_result(node)
+        if all(state == 'done' for state in self.state.values()):
+            self.finished.set()
+
+    async def run_worker(self, worker):
+        try:
+            while True:
+                node = self.take_node(worker)
+                if node is None:
+                    break
+                self.state[node] = 'running'
+                completed, info = await self.search(worker, node)
+                if not completed:
+                    # interrupted, search it again later
+                    self.state[node] = 'pending'
+                    if node not in self.nodes:
+                        self.urgent.append(node)
+                    continue
+                if info is not None:
+                    node.store_analysis(info)
+                    self.analysis_cache.put(position_key(node.board), info)
+                self.finish(node)
+                worker.next_node = node.parent
+        except Exception as e:
+            print(f"Error in game review: {str(e)}")
+        finally:
+            self.scheduler.release(worker)
+            self.analysis_cache.flush()
+
+    async def search(self, worker, node):
+        # Returns whether the search ran to its end, and its last main line info. Engines may
+        # stop short of the depth, e.g. on a forced mate or a single legal move.
+        lease = await self.scheduler.acquire(worker, self.engine_command, self.threads_per_worker, worker.interrupt,
+                                             self.priority)
+        if lease is None:
+            return False, None
+        worker.interrupted = False
+        best = None
+        try:
+            options = {"Threads": lease.threads}
+            if "Hash" not in lease.session.options and lease.hash_mb is not None:
+                # an engine shared with an engine widget keeps the hash size (and contents) it has
+                options["Hash"] = lease.hash_mb
+            await lease.session.configure(options)
+            if worker.interrupted:
+                return False, None
+            with await lease.session.analysis(node.board_with_history(), chess.engine.Limit(depth=self.depth)) as analysis:
+                worker.analysis = analysis
+                async for info in analysis:
+                    if "score" in info and "pv" in info and info.get("multipv", 1) == 1:
+                        best = info
+        except chess.engine.EngineTerminatedError as e:
+            print(f"Engine terminated during review: {str(e)}")
+            await asyncio.sleep(1)
+            return False, None
+        finally:
+            worker.analysis = None
+        return not worker.interrupted, best
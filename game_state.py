@@ -1,10 +1,171 @@
 import chess
+import chess.pgn
+
+from Ilmarinen.game_tree import GameTree
+
+
+def index_moves(moves):
+    # {from square: {to square: [moves]}}; several moves to one square are the promotions
+    targets = {}
+    for move in moves:
+        to_squares = targets.get(move.from_square)
+        if to_squares is None:
+            to_squares = targets[move.from_square] = {}
+        to_squares.setdefault(move.to_square, []).append(move)
+    return targets
 
 
 class GameState:
-    def __init__(self, fen='rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'):
-        # self.fen = fen
-        self.board = chess.Board(fen)
+    # The game shown on a board. Kept free of Qt so the engine and batch code can use it headless.
+    def __init__(self, fen=chess.STARTING_FEN):
+        self.starting_fen = fen
+        self.tree = GameTree(fen)
+        # Bumped on every position change. Subscribers are called with the new version
+        # right away, so nobody has to poll the board to notice a move.
+        self.version = 0
+        self.subscribers = []
+        # move indexes of the current position, built on first use after each change
+        self._targets = None
+        self._targets_version = None
+        self._premove_targets = None
+        self._premove_targets_version = None
+
+    @property
+    def board(self):
+        # The current node's snapshot: read it, change the position through the methods below
+        return self.tree.current.board
+
+    @property
+    def node(self):
+        return self.tree.current
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def position_changed(self):
+        self.version += 1
+        for callback in list(self.subscribers):
+            callback(self.version)
+
+    def reset(self):
+        self.tree = GameTree(self.starting_fen)
+        self.position_changed()
+
+    def move_targets(self):
+        # Legal moves of the current position indexed by square, generated once per position so
+        # mouse input only does dictionary lookups
+        if self._targets_version != self.version:
+            self._targets = index_moves(self.board.legal_moves)
+            self._targets_version = self.version
+        return self._targets
+
+    def premove_targets(self):
+        # The same for the side not to move: its pseudo-legal moves if it were its turn. A
+        # premove is checked against the real legal moves when it is played.
+        if self._premove_targets_version != self.version:
+            board = self.board.copy(stack=False)
+            board.turn = not board.turn
+            board.ep_square = None
+            self._premove_targets = index_moves(board.pseudo_legal_moves)
+            self._premove_targets_version = self.version
+        return self._premove_targets
+
+    def find_move(self, start_square, end_square, promotion=None):
+        # The legal move between two squares (names or chess squares), None if there is none.
+        # Promotions need the promotion piece type.
+        try:
+            if isinstance(start_square, str):
+                start_square = chess.parse_square(start_square)
+            if isinstance(end_square, str):
+                end_square = chess.parse_square(end_square)
+        except ValueError:
+            return None
+        if self._targets_version != self.version:
+            # nobody looked at this position's moves yet, one legality check is cheaper than the index
+            move = chess.Move(start_square, end_square, promotion)
+            return move if self.board.is_legal(move) else None
+        for move in self.move_targets().get(start_square, {}).get(end_square, ()):
+            if move.promotion == promotion:
+                return move
+        return None
+
+    def move_piece(self, start_square, end_square, promotion=None):
+        move = self.find_move(start_square, end_square, promotion)
+        if move is None:
+            return False
+        self.tree.play(move)
+        self.position_changed()
+        return True
+
+    def set_board(self, board):
+        # Replaces the game with the moves leading to board, e.g. a game loaded from a feed
+        self.tree = GameTree(board.root().fen())
+        for move in board.move_stack:
+            self.tree.play(move)
+        self.position_changed()
+
+    def push_moves(self, moves):
+        # Plays several moves with a single position change
+        pushed = False
+        for move in moves:
+            if not self.board.is_legal(move):
+                break
+            self.tree.play(move)
+            pushed = True
+        if pushed:
+            self.position_changed()
+        return pushed
+
+    def navigate(self, step):
+        # step is one of the GameTree navigation methods, e.g. GameTree.back
+        if step(self.tree):
+            self.position_changed()
+
+    def go_back(self):
+        self.navigate(GameTree.back)
+
+    def go_forward(self):
+        self.navigate(GameTree.forward)
+
+    def go_to_start(self):
+        self.navigate(GameTree.start)
+
+    def go_to_end(self):
+        self.navigate(GameTree.end)
+
+    def next_variation(self):
+        self.navigate(lambda tree: tree.switch_variation(1))
+
+    def previous_variation(self):
+        self.navigate(lambda tree: tree.switch_variation(-1))
+
+    def go_to_node(self, node):
+        self.navigate(lambda tree: tree.go_to(node))
+
+    def board_with_history(self):
+        return self.tree.board_with_history()
+
+    def load_pgn(self, path, index=0):
+        # Loads the index-th game of a PGN file and shows its final position; returns whether it was found
+        with open(path, encoding='utf-8', errors='replace') as pgn_file:
+            for _ in range(index):
+                if chess.pgn.skip_game(pgn_file) is False:
+                    return False
+            game = chess.pgn.read_game(pgn_file)
+        if game is None:
+            return False
+        self.tree = GameTree.from_pgn(game)
+        self.tree.end()
+        self.position_changed()
+        return True
+
+    def save_pgn(self, path):
+        with open(path, 'w', encoding='utf-8') as pgn_file:
+            print(self.tree.to_pgn(), file=pgn_file, end='\n\n')
 
     def get_legal_moves(self):
         return self.board.legal_moves
@@ -0,0 +1,159 @@
+import chess
+import chess.pgn
+
+
+class GameNode:
+    # One position of a game tree. Every node keeps its own board snapshot (without move
+    # stack), so jumping to any node costs nothing no matter how deep it is.
+    def __init__(self, board, move=None, parent=None):
+        self.board = board
+        self.move = move
+        self.parent = parent
+        self._san = None
+        # variations[0] is the main line
+        self.variations = []
+        self.comment = ''
+        self.ply = parent.ply + 1 if parent is not None else 0
+        # best engine result seen for this position, {multipv: info} like AnalysisCache slots
+        self.analysis = {}
+
+    def child(self, move):
+        # The existing variation starting with move, or a new one
+        for node in self.variations:
+            if node.move == move:
+                return node
+        board = self.board.copy(stack=False)
+        board.push(move)
+        node = GameNode(board, move, self)
+        self.variations.append(node)
+        return node
+
+    @property
+    def san(self):
+        # only worked out when shown, loading large games does not pay for it
+        if self._san is None and self.parent is not None:
+            self._san = self.parent.board.san(self.move)
+        return self._san
+
+    def path(self):
+        # Nodes from the root to this one
+        nodes = []
+        node = self
+        while node is not None:
+            nodes.append(node)
+            node = node.parent
+        nodes.reverse()
+        return nodes
+
+    def moves(self):
+        return [node.move for node in self.path()[1:]]
+
+    def board_with_history(self):
+        # This position with its move stack, for consumers that care about repetitions
+        path = self.path()
+        board = path[0].board.copy(stack=False)
+        for node in path[1:]:
+            board.push(node.move)
+        return board
+
+    def mainline(self):
+        # This node and the main line continuation after it
+        nodes = [self]
+        while nodes[-1].variations:
+            nodes.append(nodes[-1].variations[0])
+        return nodes
+
+    def store_analysis(self, info):
+        # Keeps an engine info if it is at least as deep as the one held for its slot
+        depth, score, pv = info.get("depth"), info.get("score"), info.get("pv")
+        if depth is None or score is None or pv is None:
+            return False
+        multipv = info.get("multipv", 1)
+        held = self.analysis.get(multipv)
+        if held is not None and held["depth"] > depth:
+            return False
+        self.analysis[multipv] = {
+            "depth": depth,
+            "seldepth": info.get("seldepth"),
+            "score": score,
+            "pv": list(pv),
+            "multipv": multipv,
+        }
+        return True
+
+
+class GameTree:
+    # A game with variations and a current node
+    def __init__(self, fen=chess.STARTING_FEN, headers=None):
+        self.root = GameNode(chess.Board(fen))
+        self.current = self.root
+        self.headers = dict(headers or {})
+
+    def play(self, move):
+        self.current = self.current.child(move)
+        return self.current
+
+    def go_to(self, node):
+        changed = node is not self.current
+        self.current = node
+        return changed
+
+    def back(self):
+        return self.current.parent is not None and self.go_to(self.current.parent)
+
+    def forward(self):
+        return bool(self.current.variations) and self.go_to(self.current.variations[0])
+
+    def start(self):
+        return self.go_to(self.root)
+
+    def end(self):
+        return self.go_to(self.current.mainline()[-1])
+
+    def switch_variation(self, step):
+        # Moves to the next (step 1) or previous (step -1) sibling of the current move
+        parent = self.current.parent
+        if parent is None or len(parent.variations) < 2:
+            return False
+        index = parent.variations.index(self.current)
+        return self.go_to(parent.variations[(index + step) % len(parent.variations)])
+
+    def board_with_history(self):
+        return self.current.board_with_history()
+
+    @classmethod
+    def from_pgn(cls, game):
+        # Builds the tree of a chess.pgn.Game, [%eval] annotations become node analysis
+        tree = cls(game.board().fen(), game.headers)
+        tree.root.comment = game.comment
+        pending = [(game, tree.root)]
+        while pending:
+            pgn_node, node = pending.pop()
+            for pgn_child in pgn_node.variations:
+                child = node.child(pgn_child.move)
+                # the [%eval] is kept as analysis, to_pgn writes it back
+                child.comment = chess.pgn.EVAL_REGEX.sub(' ', pgn_child.comment).strip()
+                score = pgn_child.eval()
+                if score is not None:
+                    child.store_analysis({"depth": pgn_child.eval_depth() or 0, "score": score, "pv": []})
+                pending.append((pgn_child, child))
+        return tree
+
+    def to_pgn(self):
+        # A chess.pgn.Game with all variations, each node's best analysis as [%eval]
+        game = chess.pgn.Game()
+        # the Seven Tag Roster defaults stay for tags the tree has no value for
+        game.headers.update(self.headers)
+        if self.root.board.fen() != chess.STARTING_FEN:
+            game.setup(self.root.board)
+        game.comment = self.root.comment
+        pending = [(self.root, game)]
+        while pending:
+            node, pgn_node = pending.pop()
+            for child in node.variations:
+                pgn_child = pgn_node.add_variation(child.move, comment=child.comment)
+                best = child.analysis.get(1)
+                if best is not None:
+                    pgn_child.set_eval(best["score"], best["depth"])
+                pending.append((child, pgn_child))
+        return game
@@ -0,0 +1,119 @@
+import os
+
+import chess
+import chess.engine
+import chess.polyglot
+import chess.syzygy
+
+# Scores of tablebase results: won positions are this far above any engine evaluation,
+# faster wins (smaller DTZ) score higher
+TABLEBASE_WIN_CP = 20000
+
+
+class LocalKnowledge:
+    # Polyglot opening books and Syzygy tablebases consulted before an engine search. The
+    # readers are opened once and kept, a lookup is a few memory-mapped reads. Results come
+    # as engine-like infos (score, pv, multipv) with a "source" and a "comment" for display.
+    def __init__(self):
+        self.books = {}
+        self.tablebase = None
+        self.tablebase_dirs = []
+
+    def add_book(self, path):
+        path = os.path.abspath(path)
+        if path not in self.books:
+            self.books[path] = chess.polyglot.open_reader(path)
+
+    def add_tablebase_dir(self, path):
+        path = os.path.abspath(path)
+        if path in self.tablebase_dirs:
+            return
+        if self.tablebase is None:
+            self.tablebase = chess.syzygy.Tablebase()
+        self.tablebase.add_directory(path)
+        self.tablebase_dirs.append(path)
+
+    def clear(self):
+        for reader in self.books.values():
+            reader.close()
+        self.books = {}
+        if self.tablebase is not None:
+            self.tablebase.close()
+        self.tablebase = None
+        self.tablebase_dirs = []
+
+    def lookup(self, board, multipv=1):
+        # ('tablebase', infos), ('book', infos) or None. Tablebase results are exact, book moves
+        # only say what is usually played.
+        if board.is_game_over():
+            return None
+        infos = self.tablebase_infos(board, multipv)
+        if infos:
+            return 'tablebase', infos
+        infos = self.book_infos(board, multipv)
+        if infos:
+            return 'book', infos
+        return None
+
+    def tablebase_infos(self, board, multipv):
+        if self.tablebase is None or chess.popcount(board.occupied) > 7 or board.castling_rights:
+            return None
+        lines = []
+        try:
+            for move in board.legal_moves:
+                board.push(move)
+                try:
+                    # the opponent's view after the move, 0 is a zeroing move's fresh counter
+                    wdl = -self.tablebase.probe_wdl(board)
+                    dtz = abs(self.tablebase.probe_dtz(board))
+                finally:
+                    board.pop()
+                lines.append((wdl, dtz, move))
+        except KeyError:
+            # a table is missing
+            return None
+        # best result first; shortest way to win, longest way to lose
+        lines.sort(key=lambda line: (-line[0], line[1] if line[0] > 0 else -line[1]))
+        infos = []
+        for index, (wdl, dtz, move) in enumerate(lines[:multipv], 1):
+            if wdl == 2:
+                cp, comment = TABLEBASE_WIN_CP - dtz, f"tablebase win, DTZ {dtz}"
+            elif wdl == -2:
+                cp, comment = -TABLEBASE_WIN_CP + dtz, f"tablebase loss, DTZ {dtz}"
+            else:
+                cp, comment = 0, {1: "cursed win", -1: "blessed loss"}.get(wdl, "tablebase draw")
+            infos.append({"depth": 0, "seldepth": 0, "multipv": index, "pv": [move], "source": "tablebase",
+                          "comment": comment, "score": chess.engine.PovScore(chess.engine.Cp(cp), board.turn)})
+        return infos
+
+    def book_infos(self, board, multipv):
+        weights = {}
+        for reader in self.books.values():
+            for entry in reader.find_all(board):
+                weights[entry.move] = weights.get(entry.move, 0) + entry.weight
+        total = sum(weights.values())
+        if not weights or not total:
+            return None
+        moves = sorted(weights.items(), key=lambda item: item[1], reverse=True)[:multipv]
+        return [{"depth": 0, "seldepth": 0, "multipv": index, "pv": [move], "score": None, "source": "book",
+                 "comment": f"{weight / total:.0%} of book games"}
+                for index, (move, weight) in enumerate(moves, 1)]
+
+
+_local_knowledge = None
+
+
+def get_local_knowledge():
+    # Shared by all engine widgets; ILMARINEN_BOOKS and ILMARINEN_SYZYGY take os.pathsep
+    # separated lists of Polyglot books and tablebase directories to open at startup
+    global _local_knowledge
+    if _local_knowledge is None:
+        _local_knowledge = LocalKnowledge()
+        for path in filter(None, os.environ.get('ILMARINEN_BOOKS', '').split(os.pathsep)):
+            try:
+                _local_knowledge.add_book(path)
+            except OSError as e:
+                print(f"Error opening book {path}: {str(e)}")
+        for path in filter(None, os.environ.get('ILMARINEN_SYZYGY', '').split(os.pathsep)):
+            _local_knowledge.add_tablebase_dir(path)
+    return _local_knowledge
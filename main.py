@@ -1,12 +1,59 @@
+import time
+
+startup_started = time.perf_counter()
+
+import argparse
+import sys
+from PyQt6.QtCore import QEvent, QObject, QTimer
 from PyQt6.QtWidgets import QApplication
 import asyncio
-from qasync import QEventLoop, asyncSlot
+from qasync import QEventLoop
 
+from Ilmarinen.chess_board_widget import ChessBoardWithControls
 from Ilmarinen.main_window import MainWindow
 
+
+class FirstPaintWatcher(QObject):
+    # Calls back once the watched widget has been painted for the first time
+    def __init__(self, widget, callback):
+        super().__init__(widget)
+        self.callback = callback
+        widget.installEventFilter(self)
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Type.Paint:
+            watched.removeEventFilter(self)
+            # queued, so the paint event itself has been handled when the callback runs
+            QTimer.singleShot(0, self.callback)
+        return False
+
+
+def check_startup_budget(budget_ms):
+    elapsed_ms = (time.perf_counter() - startup_started) * 1000
+    print(f"Time to first painted board: {elapsed_ms:.0f} ms (budget {budget_ms} ms)")
+    if elapsed_ms > budget_ms:
+        print("Startup budget exceeded")
+        sys.exit(1)
+    sys.exit(0)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--startup-budget', type=int, metavar='MS',
+                        help='measure the time to the first painted board, quit and exit with 1 if it took longer')
+    parser.add_argument('--follow', metavar='PGN', nargs='+', default=[],
+                        help='show the games of these growing PGN files on a wall of boards')
+    parser.add_argument('--follow-engines', action='store_true',
+                        help='start engines linked to followed boards whenever their game gets a new move')
+    args = parser.parse_args()
+
     app = QApplication([])
     mainWindow = MainWindow()
+    if args.startup_budget is not None:
+        board = next(iter(mainWindow.widgetDict[ChessBoardWithControls].values()))
+        FirstPaintWatcher(board.chessboard.viewport(), lambda: check_startup_budget(args.startup_budget))
+    if args.follow:
+        mainWindow.follow_pgn(args.follow, args.follow_engines)
     mainWindow.show()
     #async magic that fixes the backend process stopping UI interaction
     loop = QEventLoop(app)
@@ -14,4 +61,3 @@ if __name__ == "__main__":
     with loop:
         loop.run_forever()
     app.exec()
-
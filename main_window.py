@@ -1,35 +1,106 @@
 import asyncio
 
+from PyQt6.QtCore import QTimer
 from PyQt6.QtWidgets import QWidget, QGridLayout, QApplication
 from qasync import QEventLoop
 
 from Ilmarinen.chess_board_widget import ChessBoardWithControls
-from Ilmarinen.chess_engine_widget import ChessEngineWidget
 
 
 class MainWindow(QWidget):
     def __init__(self):
         super().__init__()
         self.layout = QGridLayout(self)
-        self.chess_board = ChessBoardWithControls()
-        self.chess_engine = ChessEngineWidget(self)
         self.widgetDict = {}
         self.addWidget(ChessBoardWithControls(), 0, 0)
         self.layout.setRowStretch(0, 2)
         self.layout.setColumnStretch(0, 2)
-        self.addWidget(ChessEngineWidget(self),1, 0, 1, 1)
         self.layout.setRowStretch(1, 1)
         self.layout.setColumnStretch(1, 1)
+        # The engine panel (and the engine/analysis modules behind it) is only loaded once
+        # the event loop runs, so the board is painted first
+        QTimer.singleShot(0, self.add_engine_widget)
+        QApplication.instance().focusChanged.connect(self.on_focus_changed)
 
         # print(self.widgetDict)
 
+    def add_engine_widget(self):
+        from Ilmarinen.chess_engine_widget import ChessEngineWidget
+        from Ilmarinen.explorer_widget import ExplorerWidget
+        self.addWidget(ChessEngineWidget(self), 1, 0, 1, 1)
+        explorer = ExplorerWidget(self)
+        self.addWidget(explorer, 1, 1, 1, 1)
+        explorer.link_to(next(iter(self.widgetDict[ChessBoardWithControls].values())))
 
     def addWidget(self, widget, row, col, h=1, w=1):
         self.layout.addWidget(widget, row, col, h, w)
+        self.registerWidget(widget)
+        if isinstance(widget, ChessBoardWithControls):
+            widget.close_button.clicked.connect(lambda: self.removeWidget(widget))
+            widget.close_button.show()
+
+    def registerWidget(self, widget):
         if widget.__class__ not in self.widgetDict:
             self.widgetDict[widget.__class__] = {}
         self.widgetDict[widget.__class__][widget.uuid] = widget
 
+    def follow_pgn(self, paths, start_engines=False):
+        # Live games of growing PGN files on a wall of compact boards next to the main board
+        from Ilmarinen.pgn_follower import PgnFollower
+        follower = PgnFollower(self, paths, start_engines)
+        self.addWidget(follower.wall, 0, 2, 2, 1)
+        follower.start()
+        return follower
+
+    def removeWidget(self, widget):
+        from Ilmarinen.explorer_widget import ExplorerWidget
+        engines = self.engine_widgets()
+        self.layout.removeWidget(widget)
+        self.widgetDict.get(widget.__class__, {}).pop(widget.uuid, None)
+        # engines of a removed board stop and hand their process back to the scheduler
+        for engine in engines:
+            if engine is widget:
+                engine.stop_analysis()
+                engine.review_panel.stop_review()
+                # a removed engine panel gives up the focus as well
+                engine.scheduler.forget(engine)
+            elif self.is_linked(engine, widget):
+                engine.stop_analysis()
+                engine.review_panel.stop_review()
+                engine.linked_board_widget.game_state.unsubscribe(engine.on_position_changed)
+                del engine.linked_board_widget
+                engine.link_board_button.setText('Link board')
+        chessboard = getattr(widget, 'chessboard', None)
+        for explorer in self.widgetDict.get(ExplorerWidget, {}).values():
+            if chessboard is not None and explorer.linked_board_widget is chessboard:
+                explorer.unlink()
+        widget.deleteLater()
+
+    def board_widgets(self):
+        # every widget an engine can be linked to, ChessBoardWithControls and CompactChessBoard alike
+        return {uuid: widget for widgets in self.widgetDict.values() for uuid, widget in widgets.items()
+                if hasattr(widget, 'chessboard')}
+
+    def engine_widgets(self):
+        from Ilmarinen.chess_engine_widget import ChessEngineWidget
+        return list(self.widgetDict.get(ChessEngineWidget, {}).values())
+
+    def is_linked(self, engine, board_widget):
+        chessboard = getattr(board_widget, 'chessboard', None)
+        return chessboard is not None and getattr(engine, 'linked_board_widget', None) is chessboard
+
+    def on_focus_changed(self, old, new):
+        # The engine of the board or engine panel the user works with gets priority in the scheduler
+        widget = new
+        while widget is not None and widget.__class__ not in self.widgetDict:
+            widget = widget.parentWidget()
+        if widget is None:
+            return
+        for engine in self.engine_widgets():
+            if engine is widget or self.is_linked(engine, widget):
+                engine.scheduler.set_focus(engine)
+                return
+
 
 if __name__ == '__main__':
     app = QApplication([])
@@ -41,4 +112,4 @@ if __name__ == '__main__':
     asyncio.set_event_loop(loop)
     with loop:
         loop.run_forever()
-    app.exec()
\ No newline at end of file
+    app.exec()
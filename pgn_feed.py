@@ -0,0 +1,265 @@
+import codecs
+import os
+import re
+import time
+from collections import OrderedDict
+
+import chess
+
+# Games are matched across re-publications of the same broadcast by these headers
+GAME_KEY_TAGS = ('Event', 'Site', 'Round', 'White', 'Black')
+
+# One PGN token at the start of the buffer. Tokens that could still grow (a move at the very
+# end of the buffer, an unterminated comment or header) do not match, so they wait for the
+# next read instead of being cut in half.
+TOKEN_RE = re.compile(r'''
+    (?P<space>\s+)
+  | \[\s*(?P<tag>[A-Za-z0-9_]+)\s+"(?P<value>(?:[^"\\]|\\.)*)"\s*\]
+  | (?P<comment>\{[^}]*\}|;[^\n]*\n|%[^\n]*\n)
+  | (?P<open>\()
+  | (?P<close>\))
+  | (?P<result>(?:1-0|0-1|1/2-1/2|\*)(?=[\s\[\](){};]))
+  | (?P<number>\d+\.+(?=[^.]))
+  | (?P<nag>\$\d+(?=[^\d]))
+  | (?P<san>[^\s\[\](){};$]+(?=[\s\[\](){};$]))
+''', re.VERBOSE)
+# the characters that end a move, move number or result
+DELIMITER_RE = re.compile(r'[\s\[\](){};$]')
+
+
+def can_grow(buffer, position):
+    # Whether the text at position that no token matches may still become one when more data
+    # arrives. Anything else (a stray ']', a '$' without digits, a broken tag line) is skipped.
+    first = buffer[position]
+    if first == '{' or first == ';' or first == '%':
+        # a comment still missing its end
+        return True
+    if first == '[':
+        return '\n' not in buffer[position:]
+    if first == '$':
+        return buffer[position + 1:].isdigit()
+    if first == ']' or first == '}':
+        return False
+    # a move, move number or result still missing the delimiter after it
+    return DELIMITER_RE.search(buffer, position) is None
+
+class FeedGame:
+    # The latest known state of one game of the feed, plus the moves not yet handed out
+    def __init__(self, key, headers):
+        self.key = key
+        self.headers = dict(headers)
+        fen = self.headers.get('FEN') if self.headers.get('SetUp', '1') == '1' else None
+        try:
+            self.board = chess.Board(fen or chess.STARTING_FEN)
+        except ValueError:
+            print(f"Invalid FEN in feed game {key}: {fen}")
+            self.board = chess.Board()
+        self.sans = []
+        self.result = '*'
+        self.updated = time.monotonic()
+        # what changed since the last poll: a new game or a corrected move replaces the whole
+        # position, otherwise only the new moves are handed out
+        self.restarted = True
+        self.new_moves = []
+
+    def apply_san(self, ply, san):
+        # Called with every mainline move of every re-publication of the game; moves already
+        # known are skipped, a different move at a known ply rewinds the game to that ply
+        san = san.rstrip('!?')
+        if ply < len(self.sans):
+            if self.sans[ply] == san:
+                return True
+            del self.sans[ply:]
+            while len(self.board.move_stack) > ply:
+                self.board.pop()
+            self.restarted = True
+            self.new_moves = []
+        try:
+            move = self.board.parse_san(san)
+        except ValueError:
+            print(f"Illegal move {san} in feed game {self.key}")
+            return False
+        self.board.push(move)
+        self.sans.append(san)
+        if not self.restarted:
+            self.new_moves.append(move)
+        self.updated = time.monotonic()
+        return True
+
+    def take_update(self):
+        update = self.restarted, self.new_moves
+        self.restarted = False
+        self.new_moves = []
+        return update
+
+
+class PgnTail:
+    # Follows one growing PGN file: reads only what was appended since the last read and keeps
+    # the parser state of the game in progress between reads
+    def __init__(self, path, feed):
+        self.path = path
+        self.feed = feed
+        self.inode = None
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.buffer = ''
+        self.position = 0
+        # False while parse() stopped on its deadline with complete tokens left in the buffer
+        self.parsed = True
+        self.headers = {}
+        self.game = None
+        self.ply = 0
+        # set by an unreadable move: the rest of this publication of the game is ignored
+        self.broken = False
+        self.depth = 0
+
+    def read(self, chunk_size):
+        # Appends at most chunk_size new bytes to the buffer; returns whether there is anything to parse
+        if not self.parsed:
+            return True
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            # replaced or truncated: start over, games already known only get the moves they miss
+            self.inode = stat.st_ino
+            self.reset()
+        if stat.st_size == self.offset:
+            return False
+        with open(self.path, 'rb') as pgn_file:
+            pgn_file.seek(self.offset)
+            data = pgn_file.read(chunk_size)
+        self.offset += len(data)
+        self.buffer = self.buffer[self.position:] + self.decoder.decode(data)
+        self.position = 0
+        if len(self.buffer) > 16 * chunk_size:
+            print(f"Skipping unparsable PGN data in {self.path}")
+            self.buffer = ''
+        return True
+
+    def parse(self, deadline):
+        # Handles complete tokens until the buffer runs dry or the deadline passes
+        buffer = self.buffer
+        position = self.position
+        match = TOKEN_RE.match
+        self.parsed = False
+        start = position
+        while position < len(buffer):
+            if position != start and time.perf_counter() > deadline:
+                break
+            token = match(buffer, position)
+            if token is None:
+                if can_grow(buffer, position):
+                    # the rest is an incomplete token
+                    self.parsed = True
+                    break
+                position += 1
+                continue
+            position = token.end()
+            kind = token.lastgroup
+            if kind == 'space' or kind == 'comment' or kind == 'nag' or kind == 'number':
+                continue
+            if kind == 'value':
+                if self.game is not None:
+                    # the previous game ended without a result
+                    self.end_game()
+                self.headers[token.group('tag')] = token.group('value')
+                continue
+            if kind == 'open':
+                self.depth += 1
+                continue
+            if kind == 'close':
+                self.depth = max(0, self.depth - 1)
+                continue
+            if self.depth:
+                continue
+            if self.game is None:
+                self.game = self.feed.game(self.headers)
+                self.ply = 0
+                self.broken = False
+            if kind == 'result':
+                self.game.result = token.group('result')
+                self.end_game()
+            elif self.broken:
+                # later moves would land on the wrong ply, the game keeps its last good position
+                continue
+            elif self.game.apply_san(self.ply, token.group('san')):
+                self.ply += 1
+                self.feed.touched[self.game.key] = self.game
+            else:
+                self.broken = True
+        else:
+            self.parsed = True
+        self.position = position
+        if position == len(buffer):
+            self.buffer = ''
+            self.position = 0
+
+    def end_game(self):
+        self.feed.touched[self.game.key] = self.game
+        self.headers = {}
+        self.game = None
+        self.depth = 0
+
+
+class PgnFeed:
+    # Tails any number of PGN files and tracks the current position of every game in them.
+    # poll() does a bounded amount of work, so it can run on the GUI thread from a timer, and
+    # returns the games that changed since the previous poll. At most max_games games are
+    # kept, the ones not updated for the longest time are forgotten first.
+    def __init__(self, paths=(), max_games=2000, chunk_size=1 << 16):
+        self.max_games = max_games
+        self.chunk_size = chunk_size
+        self.tails = []
+        self.games = OrderedDict()
+        self.touched = OrderedDict()
+        # keys of games forgotten since the last take_evicted()
+        self.evicted = []
+        for path in paths:
+            self.add_file(path)
+
+    def add_file(self, path):
+        path = os.path.abspath(path)
+        if all(tail.path != path for tail in self.tails):
+            self.tails.append(PgnTail(path, self))
+
+    def remove_file(self, path):
+        path = os.path.abspath(path)
+        self.tails = [tail for tail in self.tails if tail.path != path]
+
+    def game(self, headers):
+        key = tuple(headers.get(tag, '?') for tag in GAME_KEY_TAGS)
+        game = self.games.get(key)
+        if game is None:
+            game = self.games[key] = FeedGame(key, headers)
+            while len(self.games) > self.max_games:
+                evicted, _ = self.games.popitem(last=False)
+                self.touched.pop(evicted, None)
+                self.evicted.append(evicted)
+        else:
+            game.headers.update(headers)
+        self.games.move_to_end(key)
+        return game
+
+    def take_evicted(self):
+        # keys of the games dropped to stay within max_games, so their boards can go too
+        evicted, self.evicted = self.evicted, []
+        return evicted
+
+    def poll(self, budget=0.01):
+        # Returns [(game, restarted, new_moves)] for the games that changed. When restarted the
+        # whole position (game.board) is new, otherwise new_moves were played on top of the last one.
+        deadline = time.perf_counter() + budget
+        for tail in list(self.tails):
+            while time.perf_counter() < deadline and tail.read(self.chunk_size):
+                tail.parse(deadline)
+        # the next poll starts with the file that got the least time
+        if self.tails:
+            self.tails.append(self.tails.pop(0))
+        updates = [(game, *game.take_update()) for game in self.touched.values()]
+        self.touched.clear()
+        return [update for update in updates if update[1] or update[2]]
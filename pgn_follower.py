@@ -0,0 +1,60 @@
+from PyQt6.QtCore import QObject, QTimer
+
+from Ilmarinen.compact_board_widget import BoardWall
+from Ilmarinen.pgn_feed import PgnFeed
+
+
+class PgnFollower(QObject):
+    # Shows the games of growing PGN files on a wall of compact boards. The feed is polled
+    # from a timer with a small time budget per tick, so a large backlog is worked off over
+    # several ticks instead of blocking the event loop; boards only get the moves they miss.
+    def __init__(self, main_window, paths=(), start_engines=False, interval_ms=250, budget_ms=8, columns=8):
+        super().__init__(main_window)
+        self.main_window = main_window
+        self.feed = PgnFeed(paths)
+        self.start_engines = start_engines
+        self.budget = budget_ms / 1000
+        self.wall = BoardWall(main_window, columns)
+        # feed game key -> CompactChessBoard
+        self.boards = {}
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(interval_ms)
+        self.poll_timer.timeout.connect(self.poll)
+
+    def start(self):
+        self.poll_timer.start()
+
+    def stop(self):
+        self.poll_timer.stop()
+
+    def add_file(self, path):
+        self.feed.add_file(path)
+
+    def poll(self):
+        updates = self.feed.poll(self.budget)
+        # boards of games the feed forgot leave the wall, with their engines stopped
+        evicted = [self.boards.pop(key) for key in self.feed.take_evicted() if key in self.boards]
+        if evicted:
+            self.wall.remove_boards(evicted)
+        for game, restarted, new_moves in updates:
+            if self.feed.games.get(game.key) is not game:
+                # forgotten while a file was still adding moves to it
+                continue
+            board = self.boards.get(game.key)
+            if board is None:
+                board = self.boards[game.key] = self.wall.add_board()
+                board.setToolTip(f"{game.headers.get('White', '?')} - {game.headers.get('Black', '?')}"
+                                 f" ({game.headers.get('Event', '?')}, round {game.headers.get('Round', '?')})")
+                restarted = True
+            game_state = board.game_state
+            if restarted or not game_state.push_moves(new_moves):
+                # also when the board was moved on by hand and the new moves no longer fit
+                game_state.set_board(game.board)
+            if self.start_engines:
+                self.start_linked_engines(board)
+
+    def start_linked_engines(self, board):
+        # linked engines restart on their own when the position changes, idle ones are started here
+        for engine in self.main_window.engine_widgets():
+            if self.main_window.is_linked(engine, board) and engine.analysis_button.text() == "Start analysis":
+                engine.toggle_analysis()
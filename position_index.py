@@ -0,0 +1,301 @@
+import argparse
+import heapq
+import io
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+# An opening explorer index: for every (position, move) played in a PGN collection, how
+# many games White won, drew and lost. Positions are keyed by chess.polyglot.zobrist_hash.
+# The index file is a 16 byte header followed by fixed-width records sorted by
+# (key, move), so a lookup is a binary search in a memory-mapped file. Building parses
+# byte ranges of the PGN files in parallel processes, each writing sorted runs that are
+# merged into the index at the end. Nothing here imports Qt.
+
+MAGIC = b'ILMIDX01'
+HEADER = struct.Struct('<8sQ')
+# key, move, white wins, draws, black wins
+RECORD = struct.Struct('<QHIII')
+RESULTS = {'1-0': 0, '1/2-1/2': 1, '0-1': 2}
+# PGN files are split into ranges of about this size, each handled by one process
+RANGE_BYTES = 32 * 1024 * 1024
+# (position, move) counts held in memory while indexing, about 260 bytes each
+MAX_ENTRIES = 2000000
+
+
+def encode_move(move):
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def decode_move(code):
+    return chess.Move(code & 63, code >> 6 & 63, code >> 12 or None)
+
+
+class IndexVisitor(chess.pgn.BaseVisitor):
+    # Collects (zobrist key, move) of the main line up to max_ply and the game result;
+    # variations are skipped and moves past max_ply are not even parsed
+    def __init__(self, max_ply):
+        self.max_ply = max_ply
+
+    def begin_game(self):
+        self.game_result = None
+        self.positions = []
+        self.broken = False
+
+    def visit_header(self, tagname, tagvalue):
+        if tagname == 'Result':
+            self.game_result = RESULTS.get(tagvalue)
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def parse_san(self, board, san):
+        if len(self.positions) >= self.max_ply or self.broken:
+            return chess.Move.null()
+        return board.parse_san(san)
+
+    def visit_move(self, board, move):
+        if move and len(self.positions) < self.max_ply:
+            self.positions.append((chess.polyglot.zobrist_hash(board), encode_move(move)))
+
+    def handle_error(self, error):
+        self.broken = True
+
+    def result(self):
+        # games with unreadable moves are left out
+        return None if self.broken else self.game_result, self.positions
+
+
+def split_ranges(paths, range_bytes=RANGE_BYTES):
+    # [(path, start, end)] byte ranges of about range_bytes, each starting at a game
+    ranges = []
+    for path in paths:
+        size = os.path.getsize(path)
+        start = 0
+        with open(path, 'rb') as pgn_file:
+            while start < size:
+                end = min(size, start + range_bytes)
+                if end < size:
+                    pgn_file.seek(end)
+                    window_start, window = end, b''
+                    while True:
+                        data = pgn_file.read(1 << 20)
+                        if not data:
+                            end = size
+                            break
+                        window += data
+                        found = window.find(b'\n[Event ')
+                        if found >= 0:
+                            end = window_start + found + 1
+                            break
+                        # keep enough to find a marker split between two reads
+                        keep = window[-7:]
+                        window_start += len(window) - len(keep)
+                        window = keep
+                ranges.append((path, start, end))
+                start = end
+    return ranges
+
+
+def write_run(counts, run_dir):
+    fd, run_path = tempfile.mkstemp(suffix='.run', dir=run_dir)
+    with os.fdopen(fd, 'wb') as run:
+        pack = RECORD.pack
+        run.write(b''.join(pack(key, move, *results) for (key, move), results in sorted(counts.items())))
+    return run_path
+
+
+def index_range(path, start, end, max_ply, run_dir, max_entries):
+    # Worker process: counts one byte range into sorted run files, returns (games, run paths)
+    with open(path, 'rb') as pgn_file:
+        pgn_file.seek(start)
+        text = io.StringIO(pgn_file.read(end - start).decode('utf-8', errors='replace'))
+    counts = {}
+    runs = []
+    games = 0
+    visitor = IndexVisitor(max_ply)
+    while True:
+        parsed = chess.pgn.read_game(text, Visitor=lambda: visitor)
+        if parsed is None:
+            break
+        result, positions = parsed
+        if result is None or not positions:
+            continue
+        games += 1
+        for position in positions:
+            results = counts.get(position)
+            if results is None:
+                results = counts[position] = [0, 0, 0]
+            results[result] += 1
+        if len(counts) >= max_entries:
+            runs.append(write_run(counts, run_dir))
+            counts = {}
+    if counts:
+        runs.append(write_run(counts, run_dir))
+    return games, runs
+
+
+def read_run(path, block_records=65536):
+    with open(path, 'rb') as run:
+        while True:
+            block = run.read(RECORD.size * block_records)
+            if not block:
+                return
+            yield from RECORD.iter_unpack(block)
+
+
+def merge_runs(run_paths, output_path):
+    # k-way merge of sorted runs into the index, adding up records of the same (key, move)
+    count = 0
+    with open(output_path, 'wb') as output:
+        output.write(HEADER.pack(MAGIC, 0))
+        pack = RECORD.pack
+        buffer = []
+        current = None
+        for key, move, white, draws, black in heapq.merge(*(read_run(path) for path in run_paths)):
+            if current is not None and current[0] == key and current[1] == move:
+                current[2] += white
+                current[3] += draws
+                current[4] += black
+                continue
+            if current is not None:
+                buffer.append(pack(*current))
+                count += 1
+                if len(buffer) >= 65536:
+                    output.write(b''.join(buffer))
+                    buffer = []
+            current = [key, move, white, draws, black]
+        if current is not None:
+            buffer.append(pack(*current))
+            count += 1
+        output.write(b''.join(buffer))
+        output.seek(0)
+        output.write(HEADER.pack(MAGIC, count))
+    return count
+
+
+def build_index(pgn_paths, output_path, workers=None, max_ply=40, max_entries=MAX_ENTRIES, range_bytes=RANGE_BYTES):
+    # Returns (games, records) of the new index. max_entries bounds the counts held in memory
+    # by all workers together, each one writes a run when it has its share.
+    workers = workers or os.cpu_count() or 1
+    worker_entries = max(10000, max_entries // workers)
+    ranges = split_ranges(pgn_paths, range_bytes)
+    run_dir = tempfile.mkdtemp(prefix='ilmarinen-index-', dir=os.path.dirname(os.path.abspath(output_path)))
+    games = 0
+    run_paths = []
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(index_range, path, start, end, max_ply, run_dir, worker_entries)
+                       for path, start, end in ranges]
+            for done, future in enumerate(futures, 1):
+                range_games, runs = future.result()
+                games += range_games
+                run_paths.extend(runs)
+                print(f"Indexed {done}/{len(ranges)} ranges, {games} games", file=sys.stderr)
+        records = merge_runs(run_paths, output_path + '.tmp')
+        os.replace(output_path + '.tmp', output_path)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+    return games, records
+
+
+class PositionIndex:
+    # Read access to an index file
+    def __init__(self, path):
+        self.path = path
+        self.map = None
+        self.file = open(path, 'rb')
+        try:
+            # an empty file cannot be mapped, a short one has no header
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self.count = HEADER.unpack_from(self.map, 0)
+        except (OSError, ValueError, struct.error) as e:
+            self.close()
+            raise ValueError(f"{path} is not a position index: {str(e)}") from e
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a position index")
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def records(self, key):
+        # [(move code, white, draws, black)] of the position with this key
+        unpack_key = struct.Struct('<Q').unpack_from
+        offset, size = HEADER.size, RECORD.size
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if unpack_key(self.map, offset + middle * size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        while low < self.count:
+            record_key, move, white, draws, black = RECORD.unpack_from(self.map, offset + low * size)
+            if record_key != key:
+                break
+            found.append((move, white, draws, black))
+            low += 1
+        return found
+
+    def lookup(self, board):
+        # [{move, san, games, white, draws, black}] for the position, most played first. Moves that
+        # are not legal here (a hash collision) are left out.
+        moves = []
+        for code, white, draws, black in self.records(chess.polyglot.zobrist_hash(board)):
+            move = decode_move(code)
+            if not board.is_legal(move):
+                continue
+            moves.append({"move": move, "san": board.san(move), "games": white + draws + black,
+                          "white": white, "draws": draws, "black": black})
+        moves.sort(key=lambda entry: entry["games"], reverse=True)
+        return moves
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query an opening explorer index of PGN collections.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='index PGN files')
+    build.add_argument('pgn', nargs='+', help='PGN files to index')
+    build.add_argument('-o', '--output', required=True, help='index file to write')
+    build.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='number of indexing processes')
+    build.add_argument('--max-ply', type=int, default=40, help='index the first this many plies of every game')
+    build.add_argument('--max-entries', type=int, default=MAX_ENTRIES,
+                       help='position counts all workers together keep in memory, about 260 bytes each')
+    query = commands.add_parser('query', help='show the moves played in a position')
+    query.add_argument('index', help='index file')
+    query.add_argument('fen', nargs='?', default=chess.STARTING_FEN)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        started = time.perf_counter()
+        games, records = build_index(args.pgn, args.output, args.workers, args.max_ply, args.max_entries)
+        print(f"Indexed {games} games into {records} records in {time.perf_counter() - started:.1f} s")
+    else:
+        index = PositionIndex(args.index)
+        started = time.perf_counter()
+        moves = index.lookup(chess.Board(args.fen))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for entry in moves:
+            games = entry["games"]
+            print(f"{entry['san']:8} {games:10} {entry['white'] / games:7.1%} {entry['draws'] / games:7.1%} "
+                  f"{entry['black'] / games:7.1%}")
+        print(f"{sum(entry['games'] for entry in moves)} games, {elapsed_ms:.2f} ms")
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+import asyncio
+import itertools
+import json
+import socket
+import uuid
+from urllib.parse import urlsplit
+
+import chess.engine
+
+from Ilmarinen.engine_server import DEFAULT_PORT, decode_info, encode_limit
+
+# Client side of engine_server. Engines on a server are addressed as tcp://host:port/name
+# and used through RemoteEngineSession, which stands in for EngineSession. Connections to a
+# server are pooled and kept open; analyses of all boards are multiplexed over them by
+# request id. A lost connection ends its running analyses with EngineTerminatedError, the
+# next request opens a new one.
+
+# connections kept open to one server
+CONNECTIONS_PER_SERVER = 2
+
+
+def is_remote(command):
+    return isinstance(command, str) and command.startswith('tcp://')
+
+
+class RemoteAnalysis:
+    # A running analysis on the server, used like chess.engine.AnalysisResult
+    def __init__(self, connection, request_id):
+        self.connection = connection
+        self.request_id = request_id
+        self.queue = asyncio.Queue()
+        self.finished = False
+        self.stopped = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def stop(self):
+        if not self.finished and not self.stopped:
+            self.stopped = True
+            self.connection.send({'id': self.request_id, 'op': 'stop'})
+
+    def post(self, item):
+        # an info, an exception to raise, or None at the end
+        if item is None or isinstance(item, Exception):
+            self.finished = True
+        self.queue.put_nowait(item)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self.queue.get()
+        if item is None:
+            raise StopAsyncIteration
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+
+class RemoteConnection:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.closed = False
+        self.requests = {}
+        self.ids = itertools.count(1)
+        self.read_task = None
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        sock = self.writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.read_task = asyncio.ensure_future(self.read_loop())
+
+    def send(self, message):
+        if not self.closed:
+            self.writer.write((json.dumps(message) + '\n').encode())
+
+    def request(self, message):
+        request = RemoteAnalysis(self, next(self.ids))
+        self.requests[request.request_id] = request
+        self.send(dict(message, id=request.request_id))
+        return request
+
+    async def read_loop(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                request = self.requests.get(message.get('id'))
+                if request is None:
+                    continue
+                if 'info' in message:
+                    request.post(decode_info(message['info']))
+                elif 'engines' in message:
+                    request.post(message['engines'])
+                if 'error' in message:
+                    del self.requests[request.request_id]
+                    request.post(chess.engine.EngineError(message['error']))
+                elif message.get('done'):
+                    del self.requests[request.request_id]
+                    request.post(None)
+        except (ConnectionError, ValueError) as e:
+            print(f"Connection to engine server {self.host}:{self.port} lost: {str(e)}")
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.writer is not None:
+            self.writer.close()
+        requests, self.requests = self.requests, {}
+        for request in requests.values():
+            request.post(chess.engine.EngineTerminatedError(f"connection to {self.host}:{self.port} closed"))
+
+
+class RemoteConnectionPool:
+    # Open connections to one server; a request goes to the least busy one
+    def __init__(self, host, port, size=CONNECTIONS_PER_SERVER):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.connections = []
+        self._open_lock = asyncio.Lock()
+
+    async def connection(self):
+        async with self._open_lock:
+            self.connections = [connection for connection in self.connections if not connection.closed]
+            idle = [connection for connection in self.connections if not connection.requests]
+            if idle:
+                return idle[0]
+            if len(self.connections) < self.size:
+                connection = RemoteConnection(self.host, self.port)
+                await connection.open()
+                self.connections.append(connection)
+                return connection
+            return min(self.connections, key=lambda connection: len(connection.requests))
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+        self.connections = []
+
+
+_pools = {}
+
+
+def get_pool(host, port):
+    pool = _pools.get((host, port))
+    if pool is None:
+        pool = _pools[host, port] = RemoteConnectionPool(host, port)
+    return pool
+
+
+def close_all_pools():
+    for pool in _pools.values():
+        pool.close()
+    _pools.clear()
+
+
+class RemoteEngineSession:
+    # EngineSession interface for an engine on an engine server. Options are sent along with
+    # every request and applied by the server; new_game() lets the server start a new game
+    # on its engine process instead of reusing the hash.
+    def __init__(self, command):
+        self.command = command
+        url = urlsplit(command)
+        self.host = url.hostname or 'localhost'
+        self.port = url.port or DEFAULT_PORT
+        self.engine_name = url.path.strip('/')
+        self.options = {}
+        self.game = uuid.uuid4().hex
+
+    @property
+    def alive(self):
+        return True
+
+    async def start(self):
+        return await get_pool(self.host, self.port).connection()
+
+    async def configure(self, options):
+        self.options.update(options)
+
+    def new_game(self):
+        self.game = uuid.uuid4().hex
+
+    async def engines(self):
+        # names of the engines the server offers
+        connection = await self.start()
+        request = connection.request({'op': 'engines'})
+        async for engines in request:
+            return engines
+        return []
+
+    async def analysis(self, board, limit=None, multipv=None):
+        root = board.root()
+        message = {'op': 'analysis', 'engine': self.engine_name, 'fen': root.fen(),
+                   'moves': [move.uci() for move in board.move_stack], 'multipv': multipv,
+                   'limit': encode_limit(limit), 'options': self.options, 'game': self.game}
+        error = None
+        for attempt in range(2):
+            try:
+                connection = await self.start()
+            except OSError as e:
+                error = e
+                continue
+            return connection.request(message)
+        # the widget and the review retry on EngineTerminatedError
+        raise chess.engine.EngineTerminatedError(f"engine server {self.host}:{self.port}: {str(error)}")
+
+    async def analyse(self, board, limit, multipv=None):
+        # the last info of each line, like chess.engine.Protocol.analyse
+        latest = {}
+        with await self.analysis(board, limit, multipv) as analysis:
+            async for info in analysis:
+                latest[info.get('multipv', 1)] = info
+        if multipv is None:
+            return latest.get(1, {})
+        return [latest[line] for line in sorted(latest)]
+
+    async def quit(self):
+        # the server keeps its engines; connections are shared with other sessions
+        pass
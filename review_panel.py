@@ -0,0 +1,157 @@
+from PyQt6.QtCore import QPointF, Qt, QTimer
+from PyQt6.QtGui import QColor, QPainter, QPen
+from PyQt6.QtWidgets import QGridLayout, QLabel, QListWidget, QListWidgetItem, QPushButton, QSpinBox, QWidget
+
+from Ilmarinen.game_review import MATE_CP, GameReview, review_marks, white_cp
+
+MARK_COLORS = {'blunder': QColor('red'), 'mistake': QColor('darkorange'), 'inaccuracy': QColor('gold')}
+
+
+class EvalGraph(QWidget):
+    # White's evaluation over the reviewed line, with the marked moves and the position on the board
+    def __init__(self, on_node_clicked):
+        super().__init__()
+        self.on_node_clicked = on_node_clicked
+        self.nodes = []
+        self.marks = []
+        self.current = None
+        self.setMinimumHeight(80)
+
+    def x_of(self, index):
+        return index * (self.width() - 1) / max(1, len(self.nodes) - 1)
+
+    def y_of(self, cp):
+        half = (self.height() - 1) / 2
+        return half - cp / MATE_CP * half
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor('white'))
+        painter.setPen(QPen(QColor('lightgray')))
+        painter.drawLine(QPointF(0, self.y_of(0)), QPointF(self.width(), self.y_of(0)))
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        index_of = {node: index for index, node in enumerate(self.nodes)}
+        if self.current in index_of:
+            painter.setPen(QPen(QColor('steelblue')))
+            x = self.x_of(index_of[self.current])
+            painter.drawLine(QPointF(x, 0), QPointF(x, self.height()))
+        painter.setPen(QPen(QColor('black'), 1.5))
+        previous = None
+        for index, node in enumerate(self.nodes):
+            cp = white_cp(node)
+            point = None if cp is None else QPointF(self.x_of(index), self.y_of(cp))
+            # gaps are left where positions are not reviewed yet
+            if point is not None and previous is not None:
+                painter.drawLine(previous, point)
+            previous = point
+        for node, loss, mark in self.marks:
+            cp = white_cp(node)
+            if node in index_of and cp is not None:
+                painter.setPen(Qt.PenStyle.NoPen)
+                painter.setBrush(MARK_COLORS[mark])
+                painter.drawEllipse(QPointF(self.x_of(index_of[node]), self.y_of(cp)), 3.5, 3.5)
+        painter.end()
+
+    def mousePressEvent(self, event):
+        if self.nodes:
+            index = round(event.position().x() / max(1, self.width() - 1) * (len(self.nodes) - 1))
+            self.on_node_clicked(self.nodes[max(0, min(len(self.nodes) - 1, index))])
+
+
+class ReviewPanel(QWidget):
+    # Starts and shows a GameReview of the game on the engine widget's linked board
+    def __init__(self, engine_widget):
+        super().__init__()
+        self.engine_widget = engine_widget
+        self.review = None
+        self.game_state = None
+        self.review_button = QPushButton('Review game')
+        self.review_button.clicked.connect(self.toggle_review)
+        self.depth_label = QLabel('Depth')
+        self.depth_spin = QSpinBox()
+        self.depth_spin.setRange(1, 99)
+        self.depth_spin.setValue(16)
+        self.progress_label = QLabel()
+        self.graph = EvalGraph(self.go_to_node)
+        self.marks_list = QListWidget()
+        self.marks_list.setMaximumHeight(120)
+        self.marks_list.itemClicked.connect(lambda item: self.go_to_node(item.data(Qt.ItemDataRole.UserRole)))
+        self.graph.hide()
+        self.marks_list.hide()
+        self.layout = QGridLayout(self)
+        self.layout.setContentsMargins(0, 0, 0, 0)
+        self.layout.addWidget(self.review_button, 0, 0)
+        self.layout.addWidget(self.depth_label, 0, 1)
+        self.layout.addWidget(self.depth_spin, 0, 2)
+        self.layout.addWidget(self.progress_label, 0, 3, 1, 2)
+        self.layout.addWidget(self.graph, 1, 0, 1, 5)
+        self.layout.addWidget(self.marks_list, 2, 0, 1, 5)
+        self.setLayout(self.layout)
+        # results arrive in bursts, the graph and the list are refreshed at most 4 times a second
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(250)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def toggle_review(self):
+        if self.review is not None:
+            self.stop_review()
+            return
+        engine_widget = self.engine_widget
+        if not engine_widget.engine_path or not hasattr(engine_widget, 'linked_board_widget'):
+            self.progress_label.setText('Select an engine and link a board first.')
+            return
+        self.game_state = engine_widget.linked_board_widget.game_state
+        self.game_state.subscribe(self.on_position_changed)
+        self.review = GameReview(self.game_state.tree.root, engine_widget.engine_path, self.depth_spin.value(),
+                                 on_result=self.on_result)
+        self.review.prioritize(self.game_state.node)
+        self.review.start()
+        self.review_button.setText('Stop review')
+        self.graph.nodes = self.review.nodes
+        self.graph.show()
+        self.marks_list.show()
+        self.refresh()
+
+    def stop_review(self):
+        if self.review is not None:
+            self.review.stop()
+            self.review = None
+        if self.game_state is not None:
+            self.game_state.unsubscribe(self.on_position_changed)
+        self.review_button.setText('Review game')
+
+    def on_position_changed(self, version):
+        if self.review is not None and self.game_state.tree.root is self.review.nodes[0]:
+            # the position on the board is reviewed next
+            self.review.prioritize(self.game_state.node)
+        self.graph.current = self.game_state.node
+        self.graph.update()
+
+    def on_result(self, node):
+        if not self.refresh_timer.isActive():
+            self.refresh_timer.start()
+
+    def refresh(self):
+        review = self.review
+        if review is None:
+            return
+        done, total = review.done_count, len(review.state)
+        self.progress_label.setText(f"Reviewed {done}/{total} positions")
+        if review.finished.is_set():
+            self.stop_review()
+            self.progress_label.setText(f"Reviewed {done}/{total} positions, done")
+        self.graph.current = self.game_state.node
+        self.graph.marks = review_marks(self.graph.nodes)
+        self.marks_list.clear()
+        for node, loss, mark in self.graph.marks:
+            move_number = f"{(node.ply + 1) // 2}{'.' if node.ply % 2 else '...'}"
+            item = QListWidgetItem(f"{move_number} {node.san}  {mark} (-{loss / 100:.1f})")
+            item.setForeground(MARK_COLORS[mark])
+            item.setData(Qt.ItemDataRole.UserRole, node)
+            self.marks_list.addItem(item)
+        self.graph.update()
+
+    def go_to_node(self, node):
+        if self.game_state is not None:
+            self.game_state.go_to_node(node)
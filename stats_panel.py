@@ -0,0 +1,88 @@
+from PyQt6.QtCore import QEvent, QObject, QTimer
+from PyQt6.QtWidgets import QWidget, QGridLayout, QLabel, QPushButton, QFileDialog
+
+
+class PaintWatcher(QObject):
+    # Calls back whenever the watched widget receives a paint event
+    def __init__(self, widget, callback):
+        super().__init__(widget)
+        self.widget = widget
+        self.callback = callback
+        widget.installEventFilter(self)
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Type.Paint:
+            self.callback()
+        return False
+
+    def remove(self):
+        self.widget.removeEventFilter(self)
+        self.deleteLater()
+
+
+class StatsPanel(QWidget):
+    # Shows an AnalysisStats summary twice a second while visible
+    rows = [
+        ('info_rate', 'Info messages/s'),
+        ('nps', 'Nodes/s'),
+        ('depth', 'Depth'),
+        ('depth_progression', 'Depth progression'),
+        ('info_to_flush', 'Info → model (ms, median/p95)'),
+        ('flush_to_paint', 'Model → repaint (ms)'),
+        ('info_to_paint', 'Info → repaint (ms)'),
+        ('move_to_board_paint', 'Move → board repaint (ms)'),
+        ('event_loop_lag', 'Event loop lag (ms)'),
+    ]
+
+    def __init__(self, stats):
+        super().__init__()
+        self.stats = stats
+        self.layout = QGridLayout(self)
+        self.value_labels = {}
+        for row, (name, title) in enumerate(self.rows):
+            self.layout.addWidget(QLabel(title), row, 0)
+            self.value_labels[name] = QLabel('-')
+            self.layout.addWidget(self.value_labels[name], row, 1)
+        self.export_button = QPushButton('Export...')
+        self.export_button.clicked.connect(self.export)
+        self.clear_button = QPushButton('Clear')
+        self.clear_button.clicked.connect(self.stats.clear)
+        self.layout.addWidget(self.export_button, len(self.rows), 0)
+        self.layout.addWidget(self.clear_button, len(self.rows), 1)
+        self.setLayout(self.layout)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(500)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.refresh_timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        summary = self.stats.summary()
+        for name, label in self.value_labels.items():
+            value = summary.get(name)
+            if value is None:
+                text = '-'
+            elif name == 'depth':
+                text = f"{value}/{summary.get('seldepth')}"
+            elif name == 'depth_progression':
+                text = ' '.join(f"{depth}@{seconds:.1f}s" for seconds, depth in value[-6:]) or '-'
+            elif isinstance(value, tuple):
+                text = f"{value[0]:.1f} / {value[1]:.1f}"
+            elif isinstance(value, float):
+                text = f"{value:.0f}"
+            else:
+                text = f"{value:,}"
+            label.setText(text)
+
+    def export(self):
+        filename, _ = QFileDialog.getSaveFileName(self, 'Export stats', 'analysis_stats.jsonl',
+                                                  'JSON lines (*.jsonl);;CSV (*.csv)')
+        if filename:
+            count = self.stats.export(filename)
+            print(f"Exported {count} stats records to {filename}")
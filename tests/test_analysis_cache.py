@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+
+import chess
+import chess.engine
+
+from Ilmarinen.analysis_cache import AnalysisCache, position_key
+
+
+def info(board, depth, cp, multipv=1):
+    move = list(board.legal_moves)[multipv - 1]
+    return {'depth': depth, 'seldepth': depth + 2, 'score': chess.engine.PovScore(chess.engine.Cp(cp), board.turn),
+            'pv': [move], 'multipv': multipv}
+
+
+class AnalysisCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.board = chess.Board()
+        self.board.push_san('e4')
+        self.key = position_key(self.board)
+
+    def test_round_trip(self):
+        cache = AnalysisCache()
+        self.assertIsNone(cache.get(self.key))
+        self.assertTrue(cache.put(self.key, info(self.board, 10, 30)))
+        self.assertTrue(cache.put(self.key, info(self.board, 8, -20, multipv=2)))
+        slots = cache.get(self.key)
+        self.assertEqual(sorted(slots), [1, 2])
+        self.assertEqual(slots[1]['depth'], 10)
+        self.assertEqual(slots[1]['score'].white(), chess.engine.Cp(-30))
+        self.assertEqual(slots[2]['pv'], [list(self.board.legal_moves)[1]])
+
+    def test_shallower_result_is_ignored(self):
+        cache = AnalysisCache()
+        cache.put(self.key, info(self.board, 12, 30))
+        self.assertFalse(cache.put(self.key, info(self.board, 11, 90)))
+        self.assertTrue(cache.put(self.key, info(self.board, 12, 40)))
+        self.assertEqual(cache.get(self.key)[1]['score'].relative, chess.engine.Cp(40))
+        # infos without a score or a pv are not results
+        self.assertFalse(cache.put(self.key, {'depth': 20, 'multipv': 1}))
+
+    def test_least_recently_used_position_is_evicted(self):
+        cache = AnalysisCache(max_positions=2)
+        boards = [chess.Board(), self.board, chess.Board('4k3/8/8/8/8/8/8/4K2R w K - 0 1')]
+        keys = [position_key(board) for board in boards]
+        cache.put(keys[0], info(boards[0], 5, 0))
+        cache.put(keys[1], info(boards[1], 5, 0))
+        cache.get(keys[0])
+        cache.put(keys[2], info(boards[2], 5, 0))
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+
+    def test_persistence(self):
+        # a Zobrist key above 2**63 needs the signed conversion to fit in SQLite
+        keys = [self.key, (1 << 64) - 1]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'analysis.sqlite')
+            cache = AnalysisCache(path)
+            for key in keys:
+                cache.put(key, info(self.board, 15, 25))
+            cache.put(self.key, info(self.board, 9, 12, multipv=2))
+            cache.close()
+
+            reopened = AnalysisCache(path)
+            try:
+                for key in keys:
+                    slot = reopened.get(key)[1]
+                    self.assertEqual(slot['depth'], 15)
+                    self.assertEqual(slot['seldepth'], 17)
+                    self.assertEqual(slot['score'], chess.engine.PovScore(chess.engine.Cp(25), chess.BLACK))
+                    self.assertEqual(slot['pv'], [list(self.board.legal_moves)[0]])
+                self.assertEqual(sorted(reopened.get(self.key)), [1, 2])
+                self.assertIsNone(reopened.get(position_key(chess.Board())))
+            finally:
+                reopened.close()
+
+    def test_unflushed_results_are_not_persisted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'analysis.sqlite')
+            cache = AnalysisCache(path)
+            cache.put(self.key, info(self.board, 15, 25))
+            reopened = AnalysisCache(path)
+            self.assertIsNone(reopened.get(self.key))
+            cache.flush()
+            self.assertEqual(reopened.get(self.key)[1]['depth'], 15)
+            reopened.close()
+            cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+import asyncio
+import unittest
+
+from Ilmarinen.benchmarks.fake_uci_engine import fake_engine_command
+from Ilmarinen.engine_scheduler import EngineScheduler
+
+
+class Client:
+    # Stands in for an engine widget: counts how often the scheduler interrupts it
+    def __init__(self, name):
+        self.name = name
+        self.interrupts = 0
+
+    def interrupt(self):
+        self.interrupts += 1
+
+
+class EngineSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    # Leases only create sessions, the fake engine processes start when a search runs
+    def setUp(self):
+        self.command = fake_engine_command(100)
+        self.schedulers = []
+
+    async def asyncTearDown(self):
+        for scheduler in self.schedulers:
+            if scheduler.slice_handle is not None:
+                scheduler.slice_handle.cancel()
+            await asyncio.gather(*(session.quit() for session in scheduler.sessions))
+
+    def scheduler(self, **kwargs):
+        scheduler = EngineScheduler(**kwargs)
+        self.schedulers.append(scheduler)
+        return scheduler
+
+    async def acquire(self, scheduler, client, threads=8, command=None, priority=0):
+        return await asyncio.wait_for(
+            scheduler.acquire(client, command or self.command, threads, client.interrupt, priority), 5)
+
+    def waiting(self, scheduler, client, threads=8, command=None):
+        # an acquire running in the background, registered once the test yields to the loop
+        return asyncio.ensure_future(scheduler.acquire(client, command or self.command, threads, client.interrupt))
+
+    async def finish(self, waiting):
+        return await asyncio.wait_for(waiting, 5)
+
+    async def test_focused_client_gets_half_the_threads(self):
+        scheduler = self.scheduler(max_engines=3, thread_budget=8)
+        a, b, c = Client('a'), Client('b'), Client('c')
+        scheduler.set_focus(a)
+        leases = [await self.acquire(scheduler, client) for client in (a, b, c)]
+        self.assertEqual([lease.threads for lease in leases], [4, 2, 2])
+        self.assertEqual(len({lease.session for lease in leases}), 3)
+        # never more than a client asks for
+        scheduler.release(c)
+        self.assertEqual(scheduler.leases[b].threads, 4)
+        self.assertEqual((await self.acquire(scheduler, c, threads=1)).threads, 1)
+
+    async def test_focus_takes_the_engine(self):
+        scheduler = self.scheduler(max_engines=1, thread_budget=4)
+        a, b = Client('a'), Client('b')
+        lease = await self.acquire(scheduler, a)
+        waiting_b = self.waiting(scheduler, b)
+        await asyncio.sleep(0)
+        self.assertFalse(waiting_b.done())
+        scheduler.set_focus(b)
+        self.assertIs((await self.finish(waiting_b)).session, lease.session)
+        self.assertEqual(a.interrupts, 1)
+        self.assertNotIn(a, scheduler.leases)
+        # the focus is kept across a release
+        scheduler.release(b)
+        waiting_a = self.waiting(scheduler, a)
+        await asyncio.sleep(0)
+        self.assertTrue(waiting_a.done())
+        waiting_b = self.waiting(scheduler, b)
+        await self.finish(waiting_b)
+        self.assertNotIn(a, scheduler.leases)
+        await self.finish(waiting_a)
+
+    async def test_time_slices_rotate_background_clients(self):
+        scheduler = self.scheduler(max_engines=1, thread_budget=2, slice_seconds=0.05)
+        a, b = Client('a'), Client('b')
+        await self.acquire(scheduler, a)
+        lease_b = await self.acquire(scheduler, b)
+        self.assertEqual(a.interrupts, 1)
+        self.assertNotIn(a, scheduler.leases)
+        # a comes back for an engine, as the widget does when it is interrupted
+        waiting_a = self.waiting(scheduler, a)
+        self.assertIs((await self.finish(waiting_a)).session, lease_b.session)
+        self.assertEqual(b.interrupts, 1)
+        self.assertNotIn(b, scheduler.leases)
+
+    async def test_focused_client_keeps_its_engine(self):
+        scheduler = self.scheduler(max_engines=1, thread_budget=2, slice_seconds=0.05)
+        a, b = Client('a'), Client('b')
+        scheduler.set_focus(a)
+        await self.acquire(scheduler, a)
+        waiting_b = self.waiting(scheduler, b)
+        await asyncio.sleep(0.2)
+        self.assertFalse(waiting_b.done())
+        self.assertEqual(a.interrupts, 0)
+        scheduler.release(a)
+        await self.finish(waiting_b)
+
+    async def test_yield_lease_keeps_registration_and_focus(self):
+        scheduler = self.scheduler(max_engines=1, thread_budget=2)
+        a, b = Client('a'), Client('b')
+        scheduler.set_focus(a)
+        await self.acquire(scheduler, a)
+        waiting_b = self.waiting(scheduler, b)
+        await asyncio.sleep(0)
+        scheduler.yield_lease(a)
+        await self.finish(waiting_b)
+        self.assertIn(a, scheduler.clients)
+        self.assertIs(scheduler.focused, a)
+        self.assertEqual(scheduler.waiting_clients(), 0)
+        # the next acquire takes the engine back from the background client
+        await self.acquire(scheduler, a)
+        self.assertEqual(b.interrupts, 1)
+        self.assertNotIn(b, scheduler.leases)
+
+    async def test_release_wakes_waiters(self):
+        scheduler = self.scheduler(max_engines=1, thread_budget=2)
+        a, b = Client('a'), Client('b')
+        lease = await self.acquire(scheduler, a)
+        waiting_b = self.waiting(scheduler, b)
+        await asyncio.sleep(0)
+        self.assertFalse(waiting_b.done())
+        scheduler.release(a)
+        self.assertIs((await self.finish(waiting_b)).session, lease.session)
+        # a client released while waiting gets None
+        waiting_a = self.waiting(scheduler, a)
+        await asyncio.sleep(0)
+        scheduler.release(a)
+        self.assertIsNone(await self.finish(waiting_a))
+
+    async def test_idle_engine_of_another_command_is_retired(self):
+        scheduler = self.scheduler(max_engines=1, thread_budget=2)
+        a, b = Client('a'), Client('b')
+        other_command = fake_engine_command(200)
+        first = (await self.acquire(scheduler, a)).session
+        scheduler.release(a)
+        second = (await self.acquire(scheduler, b, command=other_command)).session
+        self.assertIsNot(second, first)
+        self.assertEqual(scheduler.sessions, [second])
+        self.assertEqual(second.command, other_command)
+        # the same command reuses the idle engine
+        scheduler.release(b)
+        self.assertIs((await self.acquire(scheduler, a, command=other_command)).session, second)
+
+    async def test_remote_clients_take_no_slot(self):
+        scheduler = self.scheduler(max_engines=1, thread_budget=2)
+        local, remote = Client('local'), Client('remote')
+        scheduler.set_focus(local)
+        await self.acquire(scheduler, local)
+        lease = await self.acquire(scheduler, remote, threads=16, command='tcp://127.0.0.1:9750/sf')
+        self.assertEqual(lease.threads, 16)
+        self.assertIsNone(lease.hash_mb)
+        self.assertNotIn(lease.session, scheduler.sessions)
+        self.assertIn(local, scheduler.leases)
+        self.assertEqual(scheduler.leases[local].threads, 2)
+        self.assertEqual(local.interrupts, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import asyncio
+import json
+import unittest
+
+import chess
+import chess.engine
+
+from Ilmarinen.benchmarks.fake_uci_engine import fake_engine_command
+from Ilmarinen.engine_server import EngineServer
+from Ilmarinen.remote_engine import RemoteEngineSession, close_all_pools
+
+
+class EngineServerTest(unittest.IsolatedAsyncioTestCase):
+    # Server and client on 127.0.0.1 with the fake UCI engine of the benchmarks
+    async def asyncSetUp(self):
+        self.server = EngineServer({'fake': fake_engine_command(200, max_depth=12)}, max_sessions=1)
+        listening = await self.server.start('127.0.0.1', 0)
+        self.port = listening.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        close_all_pools()
+        await self.server.close()
+
+    async def request(self, message):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        writer.write((json.dumps(message) + '\n').encode())
+        reply = json.loads(await asyncio.wait_for(reader.readline(), 10))
+        writer.close()
+        await writer.wait_closed()
+        return reply
+
+    async def test_analysis(self):
+        session = RemoteEngineSession(f'tcp://127.0.0.1:{self.port}/fake')
+        board = chess.Board()
+        board.push_san('e4')
+        infos = await asyncio.wait_for(session.analyse(board, chess.engine.Limit(depth=4), multipv=2), 10)
+        self.assertEqual([info['multipv'] for info in infos], [1, 2])
+        self.assertEqual(infos[0]['depth'], 4)
+        self.assertIn(infos[0]['pv'][0], board.legal_moves)
+        self.assertEqual(infos[0]['score'].turn, chess.BLACK)
+
+    async def test_malformed_requests_get_an_error(self):
+        for message in ({'id': 1, 'op': 'analysis', 'fen': chess.STARTING_FEN, 'limit': {'depth': 'x', 'bogus': 1}},
+                        {'id': 2, 'op': 'analysis', 'fen': 'not a fen'},
+                        {'id': 3, 'op': 'analysis'},
+                        {'id': 4, 'op': 'analysis', 'fen': chess.STARTING_FEN, 'options': {'Debug Log File': '/tmp/x'}},
+                        {'id': 5, 'op': 'analysis', 'fen': chess.STARTING_FEN, 'options': {'Threads': True}},
+                        {'id': 6, 'op': 'analysis', 'fen': chess.STARTING_FEN, 'limit': {'depth': '5'}},
+                        {'id': 7, 'op': 'analysis', 'fen': chess.STARTING_FEN, 'limit': {'time': -1}},
+                        {'id': 8, 'op': 'analysis', 'fen': chess.STARTING_FEN, 'multipv': True}):
+            reply = await self.request(message)
+            self.assertEqual(reply['id'], message['id'])
+            self.assertIn('error', reply)
+
+    async def test_closed_connections_are_forgotten(self):
+        await self.request({'id': 1, 'op': 'engines'})
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.server.connections, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+import chess
+
+from Ilmarinen.game_state import GameState
+
+
+class GameStateMovesTest(unittest.TestCase):
+    def test_move_targets(self):
+        state = GameState()
+        targets = state.move_targets()
+        self.assertEqual(sorted(chess.square_name(square) for square in targets[chess.G1]), ['f3', 'h3'])
+        self.assertEqual(len(targets[chess.E2][chess.E4]), 1)
+        self.assertNotIn(chess.E1, targets)
+        # built once per position
+        self.assertIs(state.move_targets(), targets)
+        state.move_piece('e2', 'e4')
+        self.assertIsNot(state.move_targets(), targets)
+        self.assertIn(chess.E7, state.move_targets())
+
+    def test_promotion_targets(self):
+        state = GameState('4k3/1P6/8/8/8/8/8/4K3 w - - 0 1')
+        promotions = state.move_targets()[chess.B7][chess.B8]
+        self.assertEqual(sorted(move.promotion for move in promotions),
+                         [chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN])
+        # a promotion needs its piece
+        self.assertIsNone(state.find_move('b7', 'b8'))
+        self.assertFalse(state.move_piece('b7', 'b8'))
+        self.assertTrue(state.move_piece('b7', 'b8', chess.KNIGHT))
+        self.assertEqual(state.board.piece_at(chess.B8), chess.Piece(chess.KNIGHT, chess.WHITE))
+
+    def test_castling(self):
+        state = GameState('r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1')
+        targets = state.move_targets()[chess.E1]
+        self.assertIn(chess.G1, targets)
+        self.assertIn(chess.C1, targets)
+        self.assertTrue(state.move_piece('e1', 'g1'))
+        self.assertEqual(state.board.piece_at(chess.F1), chess.Piece(chess.ROOK, chess.WHITE))
+        # no castling through an attacked square
+        state = GameState('r3k2r/8/8/8/8/8/5r2/R3K2R w KQkq - 0 1')
+        self.assertNotIn(chess.G1, state.move_targets()[chess.E1])
+        self.assertIsNone(state.find_move('e1', 'g1'))
+
+    def test_find_move_without_index(self):
+        # before the targets are built find_move checks legality directly
+        state = GameState()
+        self.assertEqual(state.find_move('g1', 'f3'), chess.Move.from_uci('g1f3'))
+        self.assertIsNone(state.find_move('g1', 'g3'))
+        self.assertIsNone(state.find_move('z9', 'e4'))
+        state = GameState('4k3/1P6/8/8/8/8/8/4K3 w - - 0 1')
+        self.assertIsNone(state.find_move(chess.B7, chess.B8))
+        self.assertEqual(state.find_move(chess.B7, chess.B8, chess.QUEEN), chess.Move.from_uci('b7b8q'))
+
+    def test_premove_targets_flip_side_to_move(self):
+        state = GameState()
+        state.move_piece('e2', 'e4')
+        # White has just moved, its premoves are the moves it would have if it were to move
+        premoves = state.premove_targets()
+        self.assertIn(chess.D1, premoves)
+        self.assertIn(chess.H5, premoves[chess.D1])
+        self.assertIn(chess.E5, premoves[chess.E4])
+        self.assertNotIn(chess.E7, premoves)
+        # not the side to move: its own targets are unchanged
+        self.assertIn(chess.E7, state.move_targets())
+        self.assertEqual(state.board.turn, chess.BLACK)
+        self.assertIs(state.premove_targets(), premoves)
+
+    def test_premove_targets_are_pseudo_legal(self):
+        # the pinned knight may move by the time the premove is played, it is checked then
+        state = GameState('4r1k1/8/8/8/8/8/4N2P/4K3 w - - 0 1')
+        state.move_piece('h2', 'h3')
+        self.assertIn(chess.C3, state.premove_targets()[chess.E2])
+        self.assertIsNone(state.find_move('e2', 'c3'))
+        # castling is a premove as well
+        state = GameState('4k3/8/8/8/8/8/7P/R3K3 w Q - 0 1')
+        state.move_piece('h2', 'h3')
+        self.assertIn(chess.C1, state.premove_targets()[chess.E1])
+        self.assertNotIn(chess.E1, state.move_targets())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import io
+import unittest
+
+import chess
+import chess.engine
+import chess.pgn
+
+from Ilmarinen.game_tree import GameTree
+
+SEVEN_TAG_ROSTER = ['Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result']
+
+
+def play(tree, *sans):
+    for san in sans:
+        tree.play(tree.current.board.parse_san(san))
+    return tree.current
+
+
+class GameTreeTest(unittest.TestCase):
+    def setUp(self):
+        # 1. e4 e5 2. Nf3 (2. Bc4) Nc6
+        self.tree = GameTree()
+        play(self.tree, 'e4', 'e5', 'Nf3', 'Nc6')
+        self.tree.go_to(self.tree.root.mainline()[2])
+        self.bc4 = play(self.tree, 'Bc4')
+        self.tree.start()
+
+    def test_navigation(self):
+        tree = self.tree
+        self.assertFalse(tree.back())
+        self.assertTrue(tree.forward())
+        self.assertEqual(tree.current.san, 'e4')
+        self.assertTrue(tree.end())
+        self.assertEqual([node.san for node in tree.current.path()[1:]], ['e4', 'e5', 'Nf3', 'Nc6'])
+        self.assertFalse(tree.end())
+        self.assertFalse(tree.forward())
+        self.assertTrue(tree.back())
+        self.assertTrue(tree.back())
+        self.assertEqual(tree.current.san, 'e5')
+        self.assertTrue(tree.start())
+        self.assertIs(tree.current, tree.root)
+
+    def test_variations(self):
+        tree = self.tree
+        nf3 = tree.root.mainline()[3]
+        tree.go_to(nf3)
+        self.assertTrue(tree.switch_variation(1))
+        self.assertIs(tree.current, self.bc4)
+        self.assertTrue(tree.switch_variation(1))
+        self.assertIs(tree.current, nf3)
+        self.assertTrue(tree.switch_variation(-1))
+        self.assertIs(tree.current, self.bc4)
+        # a move without siblings has nothing to switch to
+        tree.back()
+        self.assertFalse(tree.switch_variation(1))
+        # playing an existing move follows it instead of adding a variation
+        self.assertIs(tree.play(chess.Move.from_uci('g1f3')), nf3)
+        self.assertEqual(len(tree.current.parent.variations), 2)
+
+    def test_board_with_history(self):
+        tree = self.tree
+        tree.go_to(self.bc4)
+        board = tree.board_with_history()
+        self.assertEqual([move.uci() for move in board.move_stack], ['e2e4', 'e7e5', 'f1c4'])
+        self.assertEqual(board.fen(), self.bc4.board.fen())
+        self.assertEqual(self.bc4.moves(), board.move_stack)
+
+    def test_pgn_export_has_seven_tag_roster(self):
+        game = self.tree.to_pgn()
+        self.assertEqual(list(game.headers)[:7], SEVEN_TAG_ROSTER)
+        self.assertEqual(game.headers['Result'], '*')
+        exported = str(game)
+        self.assertIn('[Event "?"]', exported)
+        self.assertIn('1. e4 e5 2. Nf3 ( 2. Bc4 ) 2... Nc6 *', exported)
+
+    def test_pgn_export_keeps_headers_and_roster_order(self):
+        tree = GameTree(headers={'White': 'Carlsen', 'Annotator': 'Ilmarinen', 'Result': '1-0'})
+        play(tree, 'e4')
+        headers = tree.to_pgn().headers
+        self.assertEqual(list(headers)[:7], SEVEN_TAG_ROSTER)
+        self.assertEqual(headers['White'], 'Carlsen')
+        self.assertEqual(headers['Result'], '1-0')
+        self.assertEqual(headers['Black'], '?')
+        self.assertEqual(headers['Annotator'], 'Ilmarinen')
+
+    def test_pgn_round_trip(self):
+        fen = '4k3/8/8/8/8/8/8/4K2R w K - 0 1'
+        tree = GameTree(fen)
+        node = play(tree, 'O-O')
+        node.comment = 'castles'
+        node.store_analysis({'depth': 20, 'score': chess.engine.PovScore(chess.engine.Cp(500), chess.WHITE), 'pv': []})
+        exported = str(tree.to_pgn())
+        self.assertIn(f'[FEN "{fen}"]', exported)
+
+        loaded = GameTree.from_pgn(chess.pgn.read_game(io.StringIO(exported)))
+        loaded.end()
+        self.assertEqual(loaded.root.board.fen(), fen)
+        self.assertEqual(loaded.current.san, 'O-O')
+        self.assertEqual(loaded.current.comment, 'castles')
+        self.assertEqual(loaded.current.analysis[1]['score'].white(), chess.engine.Cp(500))
+        self.assertEqual(loaded.current.analysis[1]['depth'], 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
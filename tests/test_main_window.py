@@ -0,0 +1,81 @@
+import asyncio
+import os
+import unittest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt6.QtWidgets import QApplication
+from qasync import QEventLoop
+
+from Ilmarinen.benchmarks.fake_uci_engine import fake_engine_command
+from Ilmarinen.chess_board_widget import ChessBoardWithControls
+from Ilmarinen.engine_scheduler import EngineScheduler
+
+
+class MainWindowCloseTest(unittest.TestCase):
+    # Closing panels of an offscreen main window while its engine analyses with the fake UCI engine
+    def setUp(self):
+        self.app = QApplication.instance() or QApplication([])
+        self.loop = QEventLoop(self.app)
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    async def start_window(self):
+        from Ilmarinen.main_window import MainWindow
+        window = MainWindow()
+        # the engine panel is added once the event loop runs
+        while not window.engine_widgets():
+            await asyncio.sleep(0.01)
+        engine = window.engine_widgets()[0]
+        engine.scheduler = EngineScheduler(max_engines=1, thread_budget=1)
+        board = next(iter(window.widgetDict[ChessBoardWithControls].values()))
+        engine.engine_path = fake_engine_command(200)
+        engine.linked_board_widget = board.chessboard
+        board.chessboard.game_state.subscribe(engine.on_position_changed)
+        engine.start_analysis_async()
+        for _ in range(500):
+            if engine in engine.scheduler.leases:
+                break
+            await asyncio.sleep(0.01)
+        self.assertIn(engine, engine.scheduler.leases)
+        return window, board, engine
+
+    async def shut_down(self, scheduler):
+        await asyncio.sleep(0.1)
+        await asyncio.gather(*(session.quit() for session in scheduler.sessions))
+
+    def test_closing_board_frees_lease(self):
+        async def scenario():
+            window, board, engine = await self.start_window()
+            scheduler = engine.scheduler
+            board.close_button.click()
+            self.assertNotIn(engine, scheduler.leases)
+            self.assertNotIn(engine, scheduler.clients)
+            self.assertEqual(scheduler.idle, scheduler.sessions)
+            self.assertFalse(hasattr(engine, 'linked_board_widget'))
+            self.assertFalse(window.widgetDict[ChessBoardWithControls])
+            await self.shut_down(scheduler)
+            window.deleteLater()
+
+        self.loop.run_until_complete(scenario())
+
+    def test_closing_engine_panel_forgets_it(self):
+        async def scenario():
+            window, board, engine = await self.start_window()
+            scheduler = engine.scheduler
+            scheduler.set_focus(engine)
+            engine.close_button.click()
+            self.assertNotIn(engine, scheduler.leases)
+            self.assertIsNone(scheduler.focused)
+            self.assertFalse(window.engine_widgets())
+            await self.shut_down(scheduler)
+            window.deleteLater()
+
+        self.loop.run_until_complete(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import unittest
+
+import chess
+import chess.polyglot
+
+from Ilmarinen.position_index import PositionIndex, build_index, encode_move, merge_runs, write_run
+
+GAMES = """[Event "1"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 1-0
+
+[Event "2"]
+[Result "0-1"]
+
+1. e4 c5 0-1
+
+[Event "3"]
+[Result "1/2-1/2"]
+
+1. d4 d5 1/2-1/2
+
+[Event "4"]
+[Result "*"]
+
+1. e4 e5 *
+"""
+
+
+class PositionIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def open_index(self, path):
+        index = PositionIndex(path)
+        self.addCleanup(index.close)
+        return index
+
+    def write_index(self, *runs):
+        # each run is {(key, move): [white, draws, black]}
+        path = self.path('test.idx')
+        merge_runs([write_run(run, self.directory.name) for run in runs], path)
+        return self.open_index(path)
+
+    def test_binary_search(self):
+        last = (1 << 64) - 1
+        index = self.write_index({
+            (0, 1): [1, 0, 0],
+            (10, 2): [0, 1, 0],
+            (10, 3): [0, 0, 1],
+            (20, 4): [2, 2, 2],
+            (last, 5): [3, 0, 0],
+        })
+        self.assertEqual(index.count, 5)
+        # the first and the last record
+        self.assertEqual(index.records(0), [(1, 1, 0, 0)])
+        self.assertEqual(index.records(last), [(5, 3, 0, 0)])
+        # all moves of a key, in move order
+        self.assertEqual(index.records(10), [(2, 0, 1, 0), (3, 0, 0, 1)])
+        self.assertEqual(index.records(20), [(4, 2, 2, 2)])
+        # keys between, before and after the records
+        for key in (1, 9, 11, 19, 21, last - 1):
+            self.assertEqual(index.records(key), [])
+
+    def test_merge_adds_up_runs(self):
+        index = self.write_index({(7, 1): [1, 0, 0], (8, 1): [0, 1, 0]},
+                                 {(7, 1): [0, 0, 2], (9, 1): [1, 1, 1]})
+        self.assertEqual(index.count, 3)
+        self.assertEqual(index.records(7), [(1, 1, 0, 2)])
+        self.assertEqual(index.records(8), [(1, 0, 1, 0)])
+        self.assertEqual(index.records(9), [(1, 1, 1, 1)])
+
+    def test_empty_index(self):
+        index = self.write_index({})
+        self.assertEqual(index.count, 0)
+        self.assertEqual(index.records(0), [])
+
+    def test_not_an_index(self):
+        for name, data in (('empty.idx', b''), ('short.idx', b'ILM'), ('other.idx', b'NOTANIDX' + bytes(8))):
+            with open(self.path(name), 'wb') as output:
+                output.write(data)
+            with self.assertRaises(ValueError):
+                PositionIndex(self.path(name))
+
+    def test_build_and_lookup(self):
+        pgn_path = self.path('games.pgn')
+        with open(pgn_path, 'w') as pgn_file:
+            pgn_file.write(GAMES)
+        index_path = self.path('games.idx')
+        # small ranges, so games are split over several workers
+        games, records = build_index([pgn_path], index_path, workers=2, range_bytes=64)
+        # the game without a result is left out
+        self.assertEqual(games, 3)
+        index = self.open_index(index_path)
+        self.assertEqual(index.count, records)
+
+        moves = index.lookup(chess.Board())
+        self.assertEqual([(entry['san'], entry['white'], entry['draws'], entry['black']) for entry in moves],
+                         [('e4', 1, 0, 1), ('d4', 0, 1, 0)])
+        board = chess.Board()
+        board.push_san('e4')
+        self.assertEqual(sorted(entry['san'] for entry in index.lookup(board)), ['c5', 'e5'])
+        board.push_san('e5')
+        board.push_san('Nf3')
+        self.assertEqual(index.lookup(board), [])
+
+    def test_illegal_moves_are_left_out(self):
+        # a record whose move is not legal in the position comes from a hash collision
+        key = chess.polyglot.zobrist_hash(chess.Board())
+        index = self.write_index({(key, encode_move(chess.Move.from_uci('e2e4'))): [1, 0, 0],
+                                  (key, encode_move(chess.Move.from_uci('e2e5'))): [5, 0, 0]})
+        self.assertEqual([entry['san'] for entry in index.lookup(chess.Board())], ['e4'])
+
+
+if __name__ == '__main__':
+    unittest.main()